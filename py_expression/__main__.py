@@ -0,0 +1,38 @@
+import sys
+import json
+import argparse
+from .core import Exp,ExpressionError
+
+def catalogue(options):
+    """builds a catalogue file from a json file with an object of key: expression"""
+    with open(options.source,encoding='utf-8') as f:
+        expressions = json.load(f)
+    if not isinstance(expressions,dict):
+        raise ExpressionError(options.source+' must contain an object of key: expression')
+    exp = Exp()
+    operands = {}
+    for key,expression in expressions.items():
+        try:
+            operands[key] = exp.parse(expression)
+        except ExpressionError as error:
+            raise ExpressionError('key: '+key+' '+str(error))
+    count = exp.buildCatalogue(operands,options.target)
+    print('{0} expressions written to {1}'.format(count,options.target))
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m py_expression')
+    commands = parser.add_subparsers(dest='command',required=True)
+    command = commands.add_parser('catalogue',help='builds a catalogue file that Exp.loadCatalogue maps in memory')
+    command.add_argument('source',help='json file with an object of key: expression')
+    command.add_argument('target',help='catalogue file')
+    command.set_defaults(run=catalogue)
+    options = parser.parse_args(args)
+    try:
+        options.run(options)
+    except ExpressionError as error:
+        print(error,file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,42 @@
 import re
 import math
+import operator
+import gc
+import itertools
+import struct
+import mmap
+import json
+import csv
+import pickle
+import heapq
+import bisect
+import inspect
+import asyncio
+from types import FunctionType,MethodDescriptorType,WrapperDescriptorType
 import time as t
 from datetime import date,datetime,time,timedelta
 # import pytz
-from os import path,getcwd
+from os import path,getcwd,cpu_count
 from enum import Enum
+from collections import OrderedDict,deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, without it Exp.evalBatch solves row by row
+    np = None
 # from .base import *
 
 class Context():
     def __init__(self,data:dict={},parent:'Context'=None):
         self.data = data
         self._parent= parent
+        self.root = parent.root if parent is not None else self
+        # values of the shared operands solved during the evaluation
+        self.memo = parent.memo if parent is not None else {}
+        # limits of the evaluation, checked by the loops and the assignments
+        self.budget = parent.budget if parent is not None else None
 
     def newContext(self):        
         return Context({},self)
@@ -41,7 +67,17 @@ class Context():
     def init(self,name,value):
         self.data[name]=value                     
 
+    def getScope(self,depth:int=None)->dict:
+        """data of the context depth levels up, or of the root context when depth is None"""
+        if depth is None: return self.root.data
+        context = self
+        for _ in range(depth):
+            context = context._parent
+        return context.data
+
 class Contextable():
+    # the slot is declared by the class that inherits from the mixin
+    __slots__ = ()
     def __init__(self):
       self._context  = None
 
@@ -53,6 +89,7 @@ class Contextable():
         self._context=value
 
 class Managerable():
+    __slots__ = ()
     def __init__(self):
       self._mgr  = None
 
@@ -71,6 +108,117 @@ class Singleton(type):
         return cls._instances[cls]
 
 class ExpressionError(Exception):pass
+class BudgetError(ExpressionError):pass
+
+class Budget():
+    """
+    limits of an evaluation: steps (iterations of the loops), timeout in seconds and maxSize of the collections
+    and strings assigned or created by map and filter. cancel stops the evaluation from another thread
+    """
+    def __init__(self,steps:int=None,timeout:float=None,maxSize:int=None):
+        self.steps = steps
+        self.timeout = timeout
+        self.maxSize = maxSize
+        self.used = 0
+        self.deadline = None
+        self.cancelled = False
+
+    def start(self)->'Budget':
+        self.used = 0
+        self.deadline = t.perf_counter() + self.timeout if self.timeout is not None else None
+        self.cancelled = False
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+
+    def step(self):
+        self.used += 1
+        if self.steps is not None and self.used > self.steps:
+            raise BudgetError('budget of '+str(self.steps)+' steps exceeded')
+        if self.deadline is not None and t.perf_counter() > self.deadline:
+            raise BudgetError('timeout of '+str(self.timeout)+' seconds exceeded')
+        if self.cancelled: raise BudgetError('evaluation cancelled')
+
+    def check(self,value):
+        if self.maxSize is not None and isinstance(value,(list,dict,str,set,tuple)) and len(value) > self.maxSize:
+            raise BudgetError('size of '+str(len(value))+' exceeds the budget of '+str(self.maxSize))
+
+class LruCache():
+    """bounded dictionary that discards the least recently used entries, a maxsize of 0 disables it"""
+    def __init__(self,maxsize:int=1000):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+    @maxsize.setter
+    def maxsize(self,value):
+        with self._lock:
+            self._maxsize = value
+            self._evict()
+
+    def get(self,key,default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits+=1
+                return self._data[key]
+            self.misses+=1
+            return default
+
+    def set(self,key,value):
+        with self._lock:
+            if self._maxsize <= 0: return
+            self._data[key]=value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def info(self)->dict:
+        return {'size':len(self._data),'maxsize':self._maxsize,'hits':self.hits,'misses':self.misses,'evictions':self.evictions}
+
+    def _evict(self):
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+            self.evictions+=1
+
+    def __len__(self):
+        return len(self._data)
+
+class MemoizedFunction():
+    """pure function that keeps its results by arguments in a bounded cache, the unhashable arguments are not cached"""
+    missing = object()
+
+    def __init__(self,source,cacheSize:int):
+        self.source = source
+        self.cache = LruCache(cacheSize)
+
+    def __call__(self,*args):
+        # the types are part of the key, f(1) and f(1.0) or f(True) can return different values
+        key = args + tuple(map(type,args))
+        try:
+            value = self.cache.get(key,MemoizedFunction.missing)
+        except TypeError:
+            return self.source(*args)
+        if value is MemoizedFunction.missing:
+            value = self.source(*args)
+            self.cache.set(key,value)
+        return value
+
+    def info(self)->dict:
+        info = self.cache.info()
+        calls = info['hits'] + info['misses']
+        info['hitRate'] = info['hits'] / calls if calls > 0 else 0.0
+        return info
 
 class Token():
     def __init__(self):
@@ -92,10 +240,12 @@ class Token():
         self._path =value         
 
 class Operand():
+    __slots__ = ('_name','_operands','_parent','_compiled')
     def __init__(self,name,operands=[]): 
         self._name = name         
         self._operands  = operands
         self._parent = None 
+        self._compiled = None
 
     @property
     def name(self):
@@ -119,6 +269,13 @@ class Operand():
     def operands(self):
         return self._operands 
 
+    @property
+    def compiled(self):
+        return self._compiled
+    @compiled.setter
+    def compiled(self,value):
+        self._compiled =value 
+
     def __add__(self, other):return Exp().newOperator('+',[other,self]) 
     def __sub__(self, other):return Exp().newOperator('-',[other,self])    
     def __mul__(self, other):return Exp().newOperator('*',[other,self])
@@ -177,6 +334,12 @@ class Operand():
   
     def eval(self,context:dict=None):
         return Exp().eval(self,context)
+    def compile(self):
+        return Exp().compile(self)
+    def optimize(self,numeric:bool=False):
+        return Exp().optimize(self,numeric)
+    def bind(self):
+        return Exp().bind(self)
     def vars(self):
         return Exp().getVars(self)
     def constants(self):
@@ -187,17 +350,16 @@ class Operand():
         return Exp().getFunctions(self)
 
 class Constant(Operand):
+    __slots__ = ()
     def __init__(self,name,operands=[]):
       super(Constant,self).__init__(name)  
-    #   self._value  = name
-      self._type  = type(name).__name__
 
     @property
     def value(self): 
         return self.name
     @property
     def type(self): 
-        return self._type     
+        return type(self._name).__name__     
 
     def __str__(self):
         return str(self.name)
@@ -205,9 +367,14 @@ class Constant(Operand):
         return str(self.name)  
 
 class Variable(Operand,Contextable):
+    __slots__ = ('_names','_context')
     def __init__(self,name,operands=[]):
       Operand.__init__(self,name,operands) 
-      self._names = name.split('.')
+      self._names = tuple(name.split('.'))
+
+    @property
+    def names(self):
+        return self._names
 
     @property
     def value(self):
@@ -222,6 +389,7 @@ class Variable(Operand,Contextable):
     def __repr__(self):
         return self._name      
 class KeyValue(Operand):
+    __slots__ = ()
     def __init__(self,name,operands=[]):
         super(KeyValue,self).__init__(name,operands)
 
@@ -229,6 +397,7 @@ class KeyValue(Operand):
     def value(self): 
         return self._operands[0].value
 class Array(Operand):
+    __slots__ = ()
     def __init__(self,name,operands=[]):
       super(Array,self).__init__(name,operands)
 
@@ -239,6 +408,7 @@ class Array(Operand):
             list.append(p.value)
         return list 
 class Object(Operand):
+    __slots__ = ()
     def __init__(self,name,operands=[]):
       super(Object,self).__init__(name,operands)
 
@@ -250,6 +420,7 @@ class Object(Operand):
         return dic
 
 class ArrayForeach(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -263,6 +434,7 @@ class ArrayForeach(Operand,Contextable,Managerable):
             childContext.init(self.name,p)
             body.value
 class ArrayMap(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -278,6 +450,7 @@ class ArrayMap(Operand,Contextable,Managerable):
             result.append(body.value)
         return result
 class ArrayFirst(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -292,6 +465,7 @@ class ArrayFirst(Operand,Contextable,Managerable):
             if body.value : return p
         return None
 class ArrayLast(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -308,6 +482,7 @@ class ArrayLast(Operand,Contextable,Managerable):
             if body.value : return p
         return None 
 class ArrayFilter(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -323,6 +498,7 @@ class ArrayFilter(Operand,Contextable,Managerable):
             if body.value: result.append(p)
         return result        
 class ArrayReverse(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -346,6 +522,7 @@ class ArrayReverse(Operand,Contextable,Managerable):
             result.reverse()    
             return map(lambda p: p['p'],result)
 class ArraySort(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -368,6 +545,7 @@ class ArraySort(Operand,Contextable,Managerable):
             result.sort((lambda p: p["ord"]))
             return map(lambda p: p['p'],result)
 class ArrayPush(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -379,6 +557,7 @@ class ArrayPush(Operand,Contextable,Managerable):
         value.append(elemnent)
         return value
 class ArrayPop(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -392,6 +571,7 @@ class ArrayPop(Operand,Contextable,Managerable):
             index = len(self._operands) -1        
         return variable.value.pop(index)
 class ArrayRemove(Operand,Contextable,Managerable):
+    __slots__ = ('_context','_mgr')
     def __init__(self,name,operands=[]):
         Operand.__init__(self,name,operands)
 
@@ -401,30 +581,54 @@ class ArrayRemove(Operand,Contextable,Managerable):
         element= self._operands[1]
         variable.value.remove(element.value)    
 
+class Binding():
+    """implementation of a function resolved by Exp.bind, shared by the calls and updated when the function is added again"""
+    __slots__ = ('name','function')
+    def __init__(self,name,function):
+        self.name = name
+        self.function = function
+
 class Function(Operand,Managerable):
+    __slots__ = ('_mgr','_binding')
     def __init__(self,name,operands=[]):
       Operand.__init__(self,name,operands)
+      self._binding = None
+
+    @property
+    def binding(self)->Binding:
+        return self._binding
+    @binding.setter
+    def binding(self,value:Binding):
+        self._binding = value
 
     @property
     def value(self): 
         args=[]
         if '.' in self.name:
             name = self.name.replace('.','')
-            parent = self._operands.pop(0)
-            value = parent.value
-            _type = type(value).__name__
-            if isinstance(value,object) and hasattr(value, name):
-                function=getattr(value, name)
-                for p in self._operands:args.append(p.value)
-            else:    
-                function=self._mgr.getFunction(name,_type)            
-                for p in self._operands:args.append(p.value)
-                args.insert(0,value)            
+            value = self._operands[0].value
+            function = self._mgr.getMethod(name,type(value))
+            args.append(value)
+            for p in self._operands[1:]:args.append(p.value)
+        elif self._binding is not None:
+            function=self._binding.function
+            for p in self._operands:args.append(p.value)
         else:
             function=self._mgr.getFunction(self.name)
+            if function is None: raise ExpressionError('function '+self.name+' not found')
             for p in self._operands:args.append(p.value)
         return function(*args)
+class Shared(Operand):
+    """common subexpression, all the shared operands with the same name are solved once per evaluation"""
+    __slots__ = ()
+    def __init__(self,name,operands=[]):
+      super(Shared,self).__init__(name,operands)
+
+    @property
+    def value(self):
+        return self._operands[0].value
 class Block(Operand):
+    __slots__ = ()
     def __init__(self,name,elements=[]):
       super(Block,self).__init__(name,elements)
 
@@ -437,32 +641,35 @@ class Block(Operand):
     def debug(self,token:Token,level): 
         pass              
 class If(Operand):
+    __slots__ = ()
     def __init__(self,name,operands=[]):
       super(If,self).__init__(name,operands)      
 
     @property
     def value(self):         
-        if self.operands[0].value:
-           self.operands[1].value
-        elif len(self.operands) > 2 and self.operands[2] is not None:       
-            self.operands[2].value
+        if self._operands[0].value:
+           self._operands[1].value
+        elif len(self._operands) > 2 and self._operands[2] is not None:       
+            self._operands[2].value
 
     # TODO
     def debug(self,token:Token,level): 
         pass          
 class While(Operand):
+    __slots__ = ()
     def __init__(self,name,operands=[]):
       super(While,self).__init__(name,operands)      
 
     @property
     def value(self): 
-        while self.operands[0].value:
-           self.operands[1].value
+        while self._operands[0].value:
+           self._operands[1].value
 
     # TODO
     def debug(self,token:Token,level): 
         pass        
 class Operator(Operand):
+    __slots__ = ()
     def __init__(self,name,operands=[]):
       super(Operator,self).__init__(name,operands)
 
@@ -480,6 +687,7 @@ class Operator(Operand):
         pass 
 
 class NegativeDecorator(Operator):
+    __slots__ = ()
     def __init__(self,name,operands=[] ):
         super(NegativeDecorator,self).__init__(name,operands)
 
@@ -487,6 +695,7 @@ class NegativeDecorator(Operator):
     def value(self): 
         return self._operands[0].value * -1
 class NotDecorator(Operator):
+    __slots__ = ()
     def __init__(self,name,operands=[]):
       super(NotDecorator,self).__init__(name,operands)
 
@@ -494,6 +703,7 @@ class NotDecorator(Operator):
     def value(self): 
         return not self._operands[0].value 
 class IndexDecorator(Operator):
+    __slots__ = ()
     def __init__(self,name,operands=[] ):
       super(IndexDecorator,self).__init__(name,operands)        
 
@@ -502,67 +712,87 @@ class IndexDecorator(Operator):
         return self._operands[0].value[self._operands[1].value]
 
 class Addition(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a+b 
 class Subtraction (Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a-b   
 class Multiplication(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a*b 
 class Division (Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a/b  
 class Exponentiation(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a**b 
 class FloorDivision (Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a//b   
 class Mod (Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a%b 
 
 class BitAnd(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a & b 
 class BitOr(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a | b
 class BitXor(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a ^ b                  
 class BitNot(Operator):
+    __slots__ = ()
     @property
     def value(self):
         return ~ self._operands[0].value
 class LeftShift(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a << b   
 class RightShift(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a >> b   
 
 class Equal(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a==b
 class NotEqual(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a!=b          
 class GreaterThan(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a>b
 class LessThan(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a<b 
 class GreaterThanOrEqual(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a>=b
 class LessThanOrEqual(Operator):
+    __slots__ = ()
     def solve(self,a,b):
         return a<=b                
 
 class And(Operator):
+    __slots__ = ()
     @property
     def value(self):
         if not self._operands[0].value : return False
@@ -572,6 +802,7 @@ class And(Operator):
     def debug(self,token:Token,level): 
         pass 
 class Or(Operator):
+    __slots__ = ()
     @property
     def value(self):
         if self._operands[0].value : return True
@@ -580,71 +811,85 @@ class Or(Operator):
     def debug(self,token:Token,level): 
         pass 
 class Not(Operator):
+    __slots__ = ()
     @property
     def value(self):
         return not self._operands[0].value
 
 class Assigment(Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value = self._operands[1].value
         return self._operands[0].value
 class AssigmentAddition(Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value += self._operands[1].value
         return self._operands[0].value
 class AssigmentSubtraction (Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value -= self._operands[1].value
         return self._operands[0].value  
 class AssigmentMultiplication(Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value *= self._operands[1].value
         return self._operands[0].value 
 class AssigmentDivision (Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value /= self._operands[1].value
         return self._operands[0].value  
 class AssigmentExponentiation(Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value **= self._operands[1].value
         return self._operands[0].value 
 class AssigmentFloorDivision (Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value //= self._operands[1].value
         return self._operands[0].value   
 class AssigmentMod (Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value %= self._operands[1].value
         return self._operands[0].value 
 class AssigmentBitAnd(Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value &= self._operands[1].value
         return self._operands[0].value 
 class AssigmentBitOr(Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value |= self._operands[1].value
         return self._operands[0].value
 class AssigmentBitXor(Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value ^= self._operands[1].value
         return self._operands[0].value
 class AssigmentLeftShift(Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value <<= self._operands[1].value
         return self._operands[0].value
 class AssigmentRightShift(Operator):
+    __slots__ = ()
     @property
     def value(self):
         self._operands[0].value >>= self._operands[1].value
@@ -656,11 +901,23 @@ class Exp(metaclass=Singleton):
        self.reAlphanumeric = re.compile('[a-zA-Z0-9_.]+$') 
        self.reInt = re.compile('[0-9]+$')
        self.reFloat = re.compile('(\d+(\.\d*)?|\.\d+)([eE]\d+)?')
+       self.reMinify = re.compile(r'("(?:[^"]|"")*"?|\'(?:[^\']|\'\')*\'?)|\s+')
        self._operators={}
        self._tripleOperators = []
        self._doubleOperators = [] 
        self._enums={} 
        self._functions={}
+       # implementation by (name,name of the type) and by (name,type) of the dotted calls
+       self._dispatch={}
+       self._methods={}
+       self._version=0
+       self._bindings={}
+       self._lexer = None
+       self._cache = LruCache()
+       self._slots = itertools.count()
+       self._engine = 'closure'
+       self._types = {}
+       self.initTypes()
        self.initOperators()
        self.generalFunctions()
        self.mathFunctions()
@@ -670,6 +927,13 @@ class Exp(metaclass=Singleton):
        self.initEnums()
        self.refresh()
            
+    def initTypes(self):
+        # types of operand that can be created when deserializing, the operators are added with addOperator
+        for source in [Constant,Variable,KeyValue,Array,Object,ArrayForeach,ArrayMap,ArrayFirst,ArrayLast,ArrayFilter,
+                       ArrayReverse,ArraySort,ArrayPush,ArrayPop,ArrayRemove,Function,Shared,Block,If,While,
+                       NegativeDecorator,NotDecorator,IndexDecorator]:
+            self._types[source.__name__] = source
+
     def initOperators(self):       
 
         self.addOperator('+','arithmetic',Addition,4)
@@ -713,51 +977,51 @@ class Exp(metaclass=Singleton):
         self.addOperator('>>=','assignment',AssigmentRightShift,1)        
 
     def generalFunctions(self): 
-        self.addFunction('nvl',lambda a,b: a if a!=None and a!="" else b )
-        self.addFunction('isEmpty',lambda a: a==None or a =="")
+        self.addFunction('nvl',lambda a,b: a if a!=None and a!="" else b ,pure=True)
+        self.addFunction('isEmpty',lambda a: a==None or a =="",pure=True)
         self.addFunction('sleep',t.sleep)        
       
     def mathFunctions(self):
-        self.addFunction('ceil',math.ceil)
-        self.addFunction('copysign',math.copysign) 
-        self.addFunction('factorial',math.factorial) 
-        self.addFunction('floor',math.floor) 
-        self.addFunction('fmod',math.fmod) 
-        self.addFunction('frexp',math.frexp) 
-        self.addFunction('fsum',math.fsum) 
-        self.addFunction('isfinite',math.isfinite) 
-        self.addFunction('isnan',math.isnan) 
-        self.addFunction('ldexp',math.ldexp) 
-        self.addFunction('modf',math.modf) 
-        self.addFunction('trunc',math.trunc) 
-        self.addFunction('exp',math.exp) 
-        self.addFunction('expm1',math.expm1) 
-        self.addFunction('log',math.log) 
-        self.addFunction('log1p',math.log1p) 
-        self.addFunction('log2',math.log2) 
-        self.addFunction('log10',math.log10) 
-        self.addFunction('pow',math.pow) 
-        self.addFunction('sqrt',math.sqrt) 
-        self.addFunction('acos',math.acos) 
-        self.addFunction('asin',math.asin) 
-        self.addFunction('atan',math.atan) 
-        self.addFunction('atan2',math.atan2) 
-        self.addFunction('cos',math.cos) 
-        self.addFunction('hypot',math.hypot) 
-        self.addFunction('sin',math.sin) 
-        self.addFunction('tan',math.tan) 
-        self.addFunction('degrees',math.degrees)
-        self.addFunction('radians',math.radians)
-        self.addFunction('acosh',math.acosh)
-        self.addFunction('asinh',math.asinh)
-        self.addFunction('atanh',math.atanh)
-        self.addFunction('cosh',math.cosh)
-        self.addFunction('sinh',math.sinh)
-        self.addFunction('tanh',math.tanh)
-        self.addFunction('erf',math.erf)
-        self.addFunction('erfc',math.erfc)
-        self.addFunction('gamma',math.gamma)
-        self.addFunction('lgamma',math.lgamma)
+        self.addFunction('ceil',math.ceil,pure=True)
+        self.addFunction('copysign',math.copysign,pure=True) 
+        self.addFunction('factorial',math.factorial,pure=True) 
+        self.addFunction('floor',math.floor,pure=True) 
+        self.addFunction('fmod',math.fmod,pure=True) 
+        self.addFunction('frexp',math.frexp,pure=True) 
+        self.addFunction('fsum',math.fsum,pure=True) 
+        self.addFunction('isfinite',math.isfinite,pure=True) 
+        self.addFunction('isnan',math.isnan,pure=True) 
+        self.addFunction('ldexp',math.ldexp,pure=True) 
+        self.addFunction('modf',math.modf,pure=True) 
+        self.addFunction('trunc',math.trunc,pure=True) 
+        self.addFunction('exp',math.exp,pure=True) 
+        self.addFunction('expm1',math.expm1,pure=True) 
+        self.addFunction('log',math.log,pure=True) 
+        self.addFunction('log1p',math.log1p,pure=True) 
+        self.addFunction('log2',math.log2,pure=True) 
+        self.addFunction('log10',math.log10,pure=True) 
+        self.addFunction('pow',math.pow,pure=True) 
+        self.addFunction('sqrt',math.sqrt,pure=True) 
+        self.addFunction('acos',math.acos,pure=True) 
+        self.addFunction('asin',math.asin,pure=True) 
+        self.addFunction('atan',math.atan,pure=True) 
+        self.addFunction('atan2',math.atan2,pure=True) 
+        self.addFunction('cos',math.cos,pure=True) 
+        self.addFunction('hypot',math.hypot,pure=True) 
+        self.addFunction('sin',math.sin,pure=True) 
+        self.addFunction('tan',math.tan,pure=True) 
+        self.addFunction('degrees',math.degrees,pure=True)
+        self.addFunction('radians',math.radians,pure=True)
+        self.addFunction('acosh',math.acosh,pure=True)
+        self.addFunction('asinh',math.asinh,pure=True)
+        self.addFunction('atanh',math.atanh,pure=True)
+        self.addFunction('cosh',math.cosh,pure=True)
+        self.addFunction('sinh',math.sinh,pure=True)
+        self.addFunction('tanh',math.tanh,pure=True)
+        self.addFunction('erf',math.erf,pure=True)
+        self.addFunction('erfc',math.erfc,pure=True)
+        self.addFunction('gamma',math.gamma,pure=True)
+        self.addFunction('lgamma',math.lgamma,pure=True)
         self.addFunction('pi',math.pi)
         self.addFunction('e',math.e)
     
@@ -765,54 +1029,54 @@ class Exp(metaclass=Singleton):
         # https://stackabuse.com/how-to-format-dates-in-python/
         # https://www.programiz.com/python-programming/datetime
 
-        self.addFunction('strftime',datetime.strftime,['datetime'])
-        self.addFunction('strptime',datetime.strptime)        
-        self.addFunction('datetime',datetime)
+        self.addFunction('strftime',datetime.strftime,['datetime'],pure=True)
+        self.addFunction('strptime',datetime.strptime,pure=True)        
+        self.addFunction('datetime',datetime,pure=True)
         self.addFunction('today',date.today)
         self.addFunction('now',datetime.now)
-        self.addFunction('date',date)
-        self.addFunction('fromtimestamp',date.fromtimestamp)
-        self.addFunction('time',time)
-        self.addFunction('timedelta',timedelta)
-        # self.addFunction('timezone',pytz.timezone) 
+        self.addFunction('date',date,pure=True)
+        self.addFunction('fromtimestamp',date.fromtimestamp,pure=True)
+        self.addFunction('time',time,pure=True)
+        self.addFunction('timedelta',timedelta,pure=True)
+        # self.addFunction('timezone',pytz.timezone,pure=True) 
 
     def stringFunctions(self):
         # https://docs.python.org/2.5/lib/string-methods.html
 
-        self.addFunction('capitalize',str.capitalize,['str'])
-        self.addFunction('count',str.count,['str'])
-        self.addFunction('encode',str.encode,['str'])
-        self.addFunction('endswith',str.endswith,['str'])
-        self.addFunction('find',str.find,['str'])
-        self.addFunction('index',str.index,['str'])
-        self.addFunction('isalnum',str.isalnum,['str'])
-        self.addFunction('isalpha',str.isalpha,['str'])
-        self.addFunction('isdigit',str.isdigit,['str'])
-        self.addFunction('islower',str.islower,['str'])
-        self.addFunction('isspace',str.isspace,['str'])
-        self.addFunction('istitle',str.istitle,['str'])
-        self.addFunction('isupper',str.isupper,['str'])
-        self.addFunction('join',str.join,['str'])
-        self.addFunction('ljust',str.ljust,['str'])
-        self.addFunction('lower',str.lower,['str'])
-        self.addFunction('lstrip',str.lstrip,['str'])
-        self.addFunction('partition',str.partition,['str'])
-        self.addFunction('replace',str.replace,['str'])
-        self.addFunction('rfind',str.rfind,['str'])
-        self.addFunction('rindex',str.rindex,['str'])
-        self.addFunction('rjust',str.rjust,['str'])
-        self.addFunction('rpartition',str.rpartition,['str'])
-        self.addFunction('rsplit',str.rsplit,['str'])
-        self.addFunction('rstrip',str.lstrip,['str'])
-        self.addFunction('split',str.split,['str'])
-        self.addFunction('splitlines',str.splitlines,['str'])
-        self.addFunction('startswith',str.startswith,['str'])
-        self.addFunction('strip',str.lstrip,['str'])
-        self.addFunction('swapcase',str.swapcase,['str'])
-        self.addFunction('title',str.title,['str'])
-        self.addFunction('translate',str.translate,['str'])
-        self.addFunction('upper',str.upper,['str'])
-        self.addFunction('zfill',str.zfill,['str'])   
+        self.addFunction('capitalize',str.capitalize,['str'],pure=True)
+        self.addFunction('count',str.count,['str'],pure=True)
+        self.addFunction('encode',str.encode,['str'],pure=True)
+        self.addFunction('endswith',str.endswith,['str'],pure=True)
+        self.addFunction('find',str.find,['str'],pure=True)
+        self.addFunction('index',str.index,['str'],pure=True)
+        self.addFunction('isalnum',str.isalnum,['str'],pure=True)
+        self.addFunction('isalpha',str.isalpha,['str'],pure=True)
+        self.addFunction('isdigit',str.isdigit,['str'],pure=True)
+        self.addFunction('islower',str.islower,['str'],pure=True)
+        self.addFunction('isspace',str.isspace,['str'],pure=True)
+        self.addFunction('istitle',str.istitle,['str'],pure=True)
+        self.addFunction('isupper',str.isupper,['str'],pure=True)
+        self.addFunction('join',str.join,['str'],pure=True)
+        self.addFunction('ljust',str.ljust,['str'],pure=True)
+        self.addFunction('lower',str.lower,['str'],pure=True)
+        self.addFunction('lstrip',str.lstrip,['str'],pure=True)
+        self.addFunction('partition',str.partition,['str'],pure=True)
+        self.addFunction('replace',str.replace,['str'],pure=True)
+        self.addFunction('rfind',str.rfind,['str'],pure=True)
+        self.addFunction('rindex',str.rindex,['str'],pure=True)
+        self.addFunction('rjust',str.rjust,['str'],pure=True)
+        self.addFunction('rpartition',str.rpartition,['str'],pure=True)
+        self.addFunction('rsplit',str.rsplit,['str'],pure=True)
+        self.addFunction('rstrip',str.lstrip,['str'],pure=True)
+        self.addFunction('split',str.split,['str'],pure=True)
+        self.addFunction('splitlines',str.splitlines,['str'],pure=True)
+        self.addFunction('startswith',str.startswith,['str'],pure=True)
+        self.addFunction('strip',str.lstrip,['str'],pure=True)
+        self.addFunction('swapcase',str.swapcase,['str'],pure=True)
+        self.addFunction('title',str.title,['str'],pure=True)
+        self.addFunction('translate',str.translate,['str'],pure=True)
+        self.addFunction('upper',str.upper,['str'],pure=True)
+        self.addFunction('zfill',str.zfill,['str'],pure=True)   
 
     def ioFunctions(self): 
         class Volume():
@@ -830,9 +1094,17 @@ class Exp(metaclass=Singleton):
         self.addEnum('DayOfWeek',{"Monday":1,"Tuesday":2,"Wednesday":3,"Thursday":4,"Friday":5,"Saturday":6,"Sunday":0})        
     
     def refresh(self):
-        for key in self._operators.keys():
-            if len(key)==2: self._doubleOperators.append(key)
-            elif len(key)==3: self._tripleOperators.append(key)
+        self._doubleOperators = [key for key in self._operators.keys() if len(key)==2]
+        self._tripleOperators = [key for key in self._operators.keys() if len(key)==3]
+        self._lexer = Lexer(self._operators.keys())
+
+    def newSlot(self)->str:
+        return '$'+str(next(self._slots))
+
+    @property
+    def lexer(self):
+        if self._lexer is None: self.refresh()
+        return self._lexer
     
     @property
     def doubleOperators(self):
@@ -850,9 +1122,15 @@ class Exp(metaclass=Singleton):
             raise ExpressionError('error with operator: '+str(key))  
     def priority(self,key):
         return self._operators[key]["priority"] if key in self._operators else -1          
+    def category(self,key):
+        return self._operators[key]["category"] if key in self._operators else None          
     def addOperator(self,key:str,category:str,source:Operator,priority:int=-1):        
         self._operators[key]={"category":category,"priority":priority,"imp":source}
+        self._types[source.__name__] = source
+        self._lexer = None
+        self.clearCache()
     def addEnum(self,key,source):
+        self.clearCache()
         if(type(source).__name__ == 'dict'):
             self._enums[key] =source
         elif issubclass(source, Enum):
@@ -870,54 +1148,338 @@ class Exp(metaclass=Singleton):
         return self._enums[name][option]
     def getEnum(self,name): 
         return self._enums[name]
-    def addFunction(self,name,source,types=['any']):
+    def addFunction(self,name,source,types=['any'],pure:bool=False,cacheSize:int=0):
+        """
+        pure indicates that the function has no side effects and its result depends only on its arguments,
+        so the optimizer can solve it with constant arguments and its calls can be shared.
+        With cacheSize the results of a pure function are kept by arguments in a bounded cache
+        """
+        if cacheSize > 0:
+            if not pure: raise ExpressionError('function '+name+' must be pure to keep its results')
+            if inspect.iscoroutinefunction(source): raise ExpressionError('function '+name+' is a coroutine, its results can not be kept')
+            source = MemoizedFunction(source,cacheSize)
+        self.clearCache()
         if name not in self._functions.keys():
             self._functions[name]= []
-        self._functions[name].append({'types':types,'imp':source})         
+        # a function added again for a type replaces the previous one
+        for p in self._functions[name]:
+            p['types'] = [_type for _type in p['types'] if _type not in types]
+        self._functions[name] = [p for p in self._functions[name] if len(p['types']) > 0]
+        self._functions[name].append({'types':types,'imp':source,'pure':pure})         
+        for p in types:
+            self._dispatch[(name,p)] = source
+        # the methods resolved, the caches of the call sites and the calls bound are updated
+        self._methods = {}
+        self._version += 1
+        if name in self._bindings:
+            self._bindings[name].function = self.getFunction(name)
     def getFunction(self,key,type='any'):
-        for p in self._functions[key]:
-            if type in p['types']:
-                return p['imp']
-        return None    
+        return self._dispatch.get((key,type))
+
+    def isAsyncFunction(self,name:str)->bool:
+        """indicates if any of the functions added with the name is a coroutine, solved by evalAsync"""
+        return any(inspect.iscoroutinefunction(p['imp']) for p in self._functions.get(name,[]))
+
+    def isPureFunction(self,name:str)->bool:
+        """indicates if all the functions added with the name are pure"""
+        return name in self._functions and all(p['pure'] for p in self._functions[name])
+
+    def functionsInfo(self)->dict:
+        """hits, misses, size and hit rate of the cache of each function that keeps its results"""
+        return {name:p['imp'].info() for name,items in self._functions.items() for p in items if isinstance(p['imp'],MemoizedFunction)}
+
+    def getMethod(self,name:str,_type:type):
+        """function that receives the value and the arguments of a dotted call on a value of the type, resolved once per type"""
+        method = self._methods.get((name,_type))
+        if method is None:
+            method = self._methods[(name,_type)] = self.resolveMethod(name,_type)
+        return method
+
+    def resolveMethod(self,name:str,_type:type):
+        # the methods of the type have priority, then the functions added for the type, its bases or any
+        if hasattr(_type,name):
+            attribute = inspect.getattr_static(_type,name,None)
+            if _type.__dictoffset__ == 0 and isinstance(attribute,(FunctionType,MethodDescriptorType,WrapperDescriptorType)):
+                # the instances do not have attributes of their own, the method of the type is called with the value
+                return getattr(_type,name)
+            return lambda value,*args: getattr(value,name)(*args)
+        for base in _type.__mro__:
+            function = self._dispatch.get((name,base.__name__))
+            if function is not None: return function
+        function = self._dispatch.get((name,'any'))
+        if function is not None: return function
+        def probe(value,*args):
+            if hasattr(value,name): return getattr(value,name)(*args)
+            raise ExpressionError('function '+name+' not found for '+_type.__name__)
+        return probe
     
     def minify(self,expression:str)->str:
-        isString=False
-        quotes=None
-        result =[]
-        buffer = list(expression)
-        for p in buffer:
-            if isString and p == quotes: isString=False 
-            elif not isString and (p == '\'' or p=='"'):
-                isString=True
-                quotes=p
-            if (p != ' ' and p!='\n' and p!='\r' and p!='\t' ) or isString:
-               result.append(p)
-        return result
+        # removes the white spaces that are not inside a string
+        return self.reMinify.sub(lambda match: match.group(1) or '',expression)
     
+    @property
+    def cacheSize(self):
+        return self._cache.maxsize
+    @cacheSize.setter
+    def cacheSize(self,value:int):
+        self._cache.maxsize = value
+
+    @property
+    def engine(self)->str:
+        """engine that solves the compiled operands, closure (nested python functions) or stack (list of instructions)"""
+        return self._engine
+    @engine.setter
+    def engine(self,value:str):
+        if value not in ('closure','stack'): raise ExpressionError('engine '+str(value)+' not supported')
+        self._engine = value
+
+    def cacheInfo(self)->dict:
+        return self._cache.info()
+
+    def clearCache(self):
+        self._cache.clear()
+
     def parse(self,expression)->Operand:
+        operand = self._cache.get(expression)
+        if operand is not None: return operand
         try:            
-            parser = Parser(self,self.minify(expression))
+            parser = Parser(self,expression)
             operand= parser.parse() 
             del parser
-            return operand  
         except Exception as error:
             raise ExpressionError('expression: '+expression+' error: '+str(error))
+        self._cache.set(expression,operand)
+        return operand  
 
-    def eval(self,operand:Operand,context:dict={})-> any :  
-        if context is not None:
-            self.setContext(operand,Context(context))
-        return operand.value
+    def eval(self,operand:Operand,context:dict={},budget:Budget=None)-> any :
+        # without context the operand is solved with the context assigned previously to the tree
+        if context is None: return operand.value
+        # the context travels as argument of the compiled function, so the same operand
+        # can be evaluated at the same time from several threads
+        _context = Context(context)
+        if budget is not None: _context.budget = budget.start()
+        return self.getCompiled(operand)(_context)
+
+    async def evalAsync(self,operand:Operand,context:dict={},budget:Budget=None)-> any :
+        """
+        evaluates the operand awaiting the functions added as coroutines, the arguments of a function and the elements
+        of an array or object that call them are solved concurrently, and, or, if and first keep short circuiting.
+        The ones with other side effects (assignments, changes in place, impure functions) are solved in order
+        """
+        compiled = operand.compiled
+        if type(compiled) is not AsyncFunction or compiled.version != self._version:
+            compiled = operand.compiled = AsyncCompiler(self).compile(operand)
+        _context = Context(context if context is not None else {})
+        if budget is not None: _context.budget = budget.start()
+        return await compiled(_context)
+
+    def profile(self,operand:Operand,contexts)->'Profile':
+        """
+        evaluates the operand for each context (dict) with closures that measure the calls, total and self time of each node.
+        The operand keeps its compiled function, so the evaluations out of the profile are not instrumented
+        """
+        profile = Profile()
+        function = ProfileCompiler(self,profile).compile(operand)
+        for context in contexts:
+            profile.evaluations += 1
+            function(Context(context))
+        return profile
+
+    def sampler(self,operand:Operand,every:int=100)->'Sampler':
+        """callable that evaluates the operand and measures one of every so many evaluations"""
+        return Sampler(self,operand,every)
+
+    def getCompiled(self,operand:Operand):
+        """compiled form of the operand, built again when the engine selected changed"""
+        compiled = operand.compiled
+        if compiled is None or type(compiled) is AsyncFunction or isinstance(compiled,Program) != (self._engine == 'stack'):
+            compiled = operand.compiled = self.newCompiled(operand)
+        return compiled
+
+    def newCompiled(self,operand:Operand):
+        """function of the engine selected that solves the operand with a Context"""
+        if self._engine == 'stack': return StackCompiler(self).compile(operand)
+        return Compiler(self).compile(operand)
 
     def debug(self,operand:Operand,token:Token,context:dict={}):
         if context is not None:
             self.setContext(operand,Context(context))
         operand.debug(token,0)
 
+    def compile(self,operand:Operand):
+        """returns a callable that receives the context dict and evaluates the operand without walking the tree"""
+        function = self.newCompiled(operand)
+        def run(context:dict=None):
+            return function(Context(context if context is not None else {}))
+        return run
+
+    def optimize(self,operand:Operand,numeric:bool=False)->Operand:
+        """
+        returns an equivalent operand with the constant and redundant operations simplified.
+        numeric indicates that the variables are int or float, so x+0 and x*1 are x. 
+        The bitwise identities (x|0, x<<0, ...) and x&0 are only simplified for operands known to be int
+        """
+        return Optimizer(self,numeric).optimize(operand)
+
+    def bind(self,operand:Operand)->Operand:
+        """
+        resolves the functions called by the operand once, the calls do not look them up on each evaluation.
+        Raises an ExpressionError with the functions that are not found, the bindings are updated by addFunction.
+        The operand is bound in place, parse returns the same cached operand for the same expression, so it is bound for all its callers
+        """
+        functions = []
+        pending = [operand]
+        while pending:
+            p = pending.pop()
+            if p is None: continue
+            if isinstance(p,Function) and '.' not in p.name: functions.append(p)
+            pending.extend(p.operands)
+        unknown = sorted({p.name for p in functions if self.getFunction(p.name) is None})
+        if len(unknown) > 0: raise ExpressionError('functions not found: '+', '.join(unknown))
+        for p in functions:
+            if p.name not in self._bindings:
+                self._bindings[p.name] = Binding(p.name,self.getFunction(p.name))
+            p.binding = self._bindings[p.name]
+        # the function compiled before binding looks the functions up
+        operand.compiled = None
+        return operand
+
+    def eliminateCommon(self,operands):
+        """
+        returns the operand, or list of operands evaluated in order against the same context, 
+        with the repeated subexpressions replaced by Shared operands that are solved once per evaluation
+        """
+        eliminator = CommonEliminator(self)
+        if isinstance(operands,list): return eliminator.eliminate(operands)
+        if isinstance(operands,Block): return Block(operands.name,eliminator.eliminate(operands.operands))
+        return eliminator.eliminate([operands])[0]
+
+    def newExpressionSet(self,operands,merge:bool=False)->'ExpressionSet':
+        return ExpressionSet(self,operands,merge)
+
+    def newReactiveGraph(self,expressions:dict,state:dict=None)->'ReactiveGraph':
+        return ReactiveGraph(self,expressions,state)
+
+    def newRuleIndex(self,rules:dict)->'RuleIndex':
+        return RuleIndex(self,rules)
+
+    def isPure(self,operand:Operand)->bool:
+        """indicates if solving the operand has no side effects, only the functions added as pure are, and reverse and last reverse the list in place"""
+        if operand is None: return True
+        if isinstance(operand,Function) and ('.' in operand.name or not self.isPureFunction(operand.name)): return False
+        if isinstance(operand,(Block,If,While,ArrayForeach,ArrayPush,ArrayPop,ArrayRemove,ArrayReverse,ArraySort,ArrayLast)): return False
+        if isinstance(operand,Operator) and self.category(operand.name) == 'assignment': return False
+        for p in operand.operands:
+            if not self.isPure(p): return False
+        return True
+
+    def evalBatch(self,operand:Operand,columns:dict):
+        """
+        evaluates the operand for all the rows of columns, a dict where each variable is a numpy array or a list.
+        Returns a numpy array, or a list when numpy is not installed
+        """
+        batch = Batch(columns)
+        if batch.length is None: raise ExpressionError('columns without values')
+        if np is None:
+            function = Compiler(self).compile(operand)
+            return [function(Context(row)) for row in batch.rows]
+        return batch.broadcast(Vectorizer(self).vectorize(operand)(batch))
+
+    def evalStream(self,operand:Operand,records,filter:bool=False,chunkSize:int=0,budget:Budget=None):
+        """
+        evaluates the operand for each record (dict) of an iterable and yields the results, or the records
+        for which the operand is true when filter is set. With chunkSize yields lists of up to chunkSize items.
+        The records are read one at a time and solved with the same compiled function and Context, the budget applies to each record
+        """
+        compiled = self.getCompiled(operand)
+        context = Context({})
+        context.budget = budget
+        memo = context.memo
+        def solve():
+            for record in records:
+                context.data = record
+                if memo: memo.clear()
+                if budget is not None: budget.start()
+                if not filter: yield compiled(context)
+                elif compiled(context): yield record
+        if chunkSize <= 0: return solve()
+        return self.chunks(solve(),chunkSize)
+
+    def evalParallel(self,operand:Operand,contexts,workers:int=None,chunkSize:int=1000):
+        """
+        evaluates the operand for each context of an iterable in a pool of processes and yields the results in order.
+        The workers receive the operand in binary form once, with the operators, enums and functions that can be pickled,
+        and solve chunks of chunkSize contexts, at most two chunks per worker are pending
+        """
+        state = self.workerState(operand)
+        window = 2 * (workers or cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers,initializer=Worker.init,initargs=(state,)) as executor:
+            pending = deque()
+            try:
+                for chunk in self.chunks(contexts,chunkSize):
+                    if len(pending) >= window:
+                        yield from pending.popleft().result()
+                    pending.append(executor.submit(Worker.solve,chunk))
+                while pending:
+                    yield from pending.popleft().result()
+            finally:
+                for p in pending: p.cancel()
+
+    def workerState(self,operand:Operand)->dict:
+        """what a process needs to solve the operand, the functions that can not be pickled (lambdas) are only
+        available in the workers created by fork"""
+        functions = []
+        for name,items in self._functions.items():
+            for p in items:
+                source,cacheSize = p['imp'],0
+                if isinstance(source,MemoizedFunction): source,cacheSize = source.source,source.cache.maxsize
+                function = (name,source,p['types'],p['pure'],cacheSize)
+                try:
+                    pickle.dumps(function)
+                except (pickle.PicklingError,AttributeError,TypeError):
+                    continue
+                functions.append(function)
+        operators = [(key,p['category'],p['imp'],p['priority']) for key,p in self._operators.items()]
+        return {'data':self.dumps(operand),'engine':self._engine,'operators':operators,'enums':dict(self._enums),'functions':functions}
+
+    def chunks(self,iterable,size:int):
+        """yields lists of up to size items of the iterable"""
+        iterator = iter(iterable)
+        while True:
+            chunk = list(itertools.islice(iterator,size))
+            if not chunk: return
+            yield chunk
+
+    def readJsonl(self,filename:str,encoding:str='utf-8'):
+        """yields the record of each line of a json lines file, the empty lines are skipped"""
+        with open(filename,encoding=encoding) as f:
+            for number,line in enumerate(f,1):
+                if not line.strip(): continue
+                try:
+                    yield json.loads(line)
+                except ValueError as error:
+                    raise ExpressionError(filename+' line '+str(number)+': '+str(error))
+
+    def readCsv(self,filename:str,types:dict=None,encoding:str='utf-8',**options):
+        """yields a dict per row of a csv file with a header, types converts the values of the columns, e.g. {'price':float}"""
+        with open(filename,encoding=encoding,newline='') as f:
+            for record in csv.DictReader(f,**options):
+                if types:
+                    for name,convert in types.items():
+                        value = record.get(name)
+                        if value is not None and value != '': record[name] = convert(value)
+                yield record
+
     def solve(self,expression:str,context:dict={})-> any :
         operand=self.parse(expression)
         return self.eval(operand,context)
 
+    def getType(self,name:str):
+        if name not in self._types: raise ExpressionError('type '+str(name)+' not found')
+        return self._types[name]
+
     def serialize(self,operand:Operand)-> dict:        
+        if operand is None: return None
         if len(operand.operands)==0:return {'n':operand.name,'t':type(operand).__name__}
         children = []                
         for p in operand.operands:
@@ -925,11 +1487,29 @@ class Exp(metaclass=Singleton):
         return {'n':operand.name,'t':type(operand).__name__,'c':children}     
 
     def deserialize(self,serialized:dict)-> Operand:
+        if serialized is None: return None
         children = []
         if 'c' in serialized:
             for p in serialized['c']:
                 children.append(self.deserialize(p))
-        return  eval(serialized['t'])(serialized['n'],children) 
+        return self.getType(serialized['t'])(serialized['n'],children) 
+
+    def dumps(self,operands)-> bytes:
+        """binary form of an operand, a list of operands or a dict of operands"""
+        return BinaryWriter(self).write(operands)
+
+    def loads(self,data:bytes):
+        """operands of the binary form, the types are taken from the types registered, the data is never evaluated"""
+        return BinaryReader(self,data).read()
+
+    def buildCatalogue(self,expressions:dict,filename:str)->int:
+        """writes the expressions (key: expression or operand) to a catalogue file, returns the number of expressions"""
+        operands = {key:(self.parse(p) if isinstance(p,str) else p) for key,p in expressions.items()}
+        return CatalogueWriter(self).write(operands,filename)
+
+    def loadCatalogue(self,filename:str)->'Catalogue':
+        """maps the catalogue file in memory, each expression is created the first time it is used"""
+        return Catalogue(self,filename)
 
  
     def getOperandByPath(self,operand:Operand,path)->Operand:
@@ -1008,11 +1588,45 @@ class Exp(metaclass=Singleton):
             info.append({'types':p['types']})
         return info;
  
+class Lexeme():
+    def __init__(self,kind:str,value:str,offset:int):
+        self.kind = kind
+        self.value = value
+        self.offset = offset
+
+    def __repr__(self):
+        return self.kind+':'+self.value
+
+class Lexer():
+    """
+    splits the expression in a single pass with a master regular expression.
+    The kinds of lexemes are value (names and numbers), string and symbol (operators and punctuation)
+    """
+    def __init__(self,operators):
+        symbols = sorted([p for p in operators if not p.isalnum()],key=len,reverse=True)
+        self.pattern = re.compile(
+            r'(?P<space>\s+)'
+            r'|(?P<string>"(?:[^"]|"")*"?|\'(?:[^\']|\'\')*\'?)'
+            r'|(?P<value>[a-zA-Z0-9_.]+)'
+            r'|(?P<symbol>'+''.join([re.escape(p)+'|' for p in symbols])+r'.)',re.DOTALL)
+
+    def tokenize(self,expression:str)->list:
+        lexemes=[]
+        for match in self.pattern.finditer(expression):
+            kind = match.lastgroup
+            if kind == 'space': continue
+            value = match.group()
+            if kind == 'string':
+                quote = value[0]
+                value = value[1:-1] if len(value) > 1 and value[-1] == quote else value[1:]
+            lexemes.append(Lexeme(kind,value,match.start()))
+        return lexemes
+
 class Parser():
     def __init__(self,mgr,expression):
        self.mgr = mgr 
-       self.buffer = list(expression)
-       self.length=len(self.buffer)
+       self.lexemes = mgr.lexer.tokenize(expression)
+       self.length=len(self.lexemes)
        self.index=0
     
     def parse(self):
@@ -1027,54 +1641,57 @@ class Parser():
 
     @property
     def previous(self):
-        return self.buffer[self.index-1] 
+        return self.lexemes[self.index-1].value
     @property
     def current(self):
-        return self.buffer[self.index]    
-    @property
-    def next(self):
-        return self.buffer[self.index+1]
+        return self.lexemes[self.index].value if self.index < self.length else None
     @property
     def end(self):
         return self.index >= self.length   
 
+    def isSymbol(self,value:str)->bool:
+        return self.index < self.length and self.lexemes[self.index].kind == 'symbol' and self.lexemes[self.index].value == value
+
+    def isChild(self)->bool:
+        return self.index < self.length and self.lexemes[self.index].kind == 'value' and self.lexemes[self.index].value.startswith('.')
+
     def getExpression(self,operand1=None,operator=None,_break=''):
-        expression = None
-        operand2 = None
-        isbreak = False               
-        while not self.end:
-            if operand1 is None and operator is None: 
-                operand1=  self.getOperand()
-                operator= self.getOperator()
-                if operator is None or operator in _break: 
-                    expression = operand1
-                    isbreak= True
-                    break
-            operand2=  self.getOperand()
+        # the operands and operators are reduced by priority with stacks, so long chains do not recurse
+        if operand1 is None and operator is None:
+            if self.end: return None
+            operand1=  self.getOperand()
+            operator= self.getOperator()
+            if operator is None or operator in _break: 
+                return self.reduce(operand1)
+        operands = [operand1]
+        operators = [operator]
+        while True:
+            operand2 = self.getOperand() if not self.end else None
+            operands.append(operand2)
             nextOperator= self.getOperator()
-            if nextOperator is None or nextOperator in _break:
-                expression= self.mgr.newOperator(operator,[operand1,operand2])
-                isbreak= True
-                break
-            elif self.priority(operator)>=self.priority(nextOperator):
-                operand1=self.mgr.newOperator(operator,[operand1,operand2])
-                operator=nextOperator
-            else:
-                operand2 = self.getExpression(operand1=operand2,operator=nextOperator,_break=_break)
-                expression= self.mgr.newOperator(operator,[operand1,operand2])
-                isbreak= True
-                break
-        if not isbreak: expression=self.mgr.newOperator(operator,[operand1,operand2])
+            if nextOperator is None or nextOperator in _break: break
+            while operators and self.priority(operators[-1])>=self.priority(nextOperator):
+                self.reduceOperator(operands,operators.pop())
+            operators.append(nextOperator)
+        while operators:
+            self.reduceOperator(operands,operators.pop())
+        return operands[0]
+
+    def reduceOperator(self,operands:list,operator:str):
+        operand2 = operands.pop()
+        operand1 = operands.pop()
+        operands.append(self.reduce(self.mgr.newOperator(operator,[operand1,operand2])))
+
+    def reduce(self,expression:Operand)->Operand:
         # if all the operands are constant, reduce the expression a constant 
-        if expression is not None and len(expression.operands)>0:    
-            allConstants=True              
+        # the functions are solved when evaluating, they can depend on the moment or on the functions added later
+        if expression is not None and len(expression.operands)>0 and not isinstance(expression,Function):    
             for p in expression.operands:
-                if type(p).__name__ !=  'Constant':
-                    allConstants=False
-                    break
-            if  allConstants:
-                value = expression.value                
-                return Constant(value)
+                if type(p).__name__ !=  'Constant': return expression
+            value = expression.value
+            # the parsed operand is cached and shared, a list or dict is built again on each evaluation
+            if isinstance(value,(list,dict,set)): return expression
+            return Constant(value)
         return expression             
 
     def getOperand(self):        
@@ -1082,29 +1699,29 @@ class Parser():
         isNot=False
         isBitNot=False
         operand=None
-        char = self.current
-        if char == '-':
+        if self.isSymbol('-'):
            isNegative=True
            self.index+=1
-           char = self.current
-        elif char == '~':
+        elif self.isSymbol('~'):
            isBitNot=True
            self.index+=1
-           char = self.current            
-        elif char == '!':
+        elif self.isSymbol('!'):
            isNot=True
            self.index+=1
-           char = self.current   
 
-        if char.isalnum():    
+        if self.end:
+            operand = None
+        elif (isNegative or isNot or isBitNot) and self.current in ['-','~','!'] and self.lexemes[self.index].kind == 'symbol':
+            operand = self.getOperand()
+        elif self.lexemes[self.index].kind == 'value':    
             value=  self.getValue()
-            if value=='if' and self.current == '(': 
+            if value=='if' and self.isSymbol('('): 
                 self.index+=1
                 operand = self.getIfBlock()
-            elif value=='while' and self.current == '(': 
+            elif value=='while' and self.isSymbol('('): 
                 self.index+=1
                 operand = self.getWhileBlock()            
-            elif not self.end and self.current == '(':
+            elif self.isSymbol('('):
                 self.index+=1
                 if '.' in value:
                     names = value.split('.')
@@ -1116,7 +1733,7 @@ class Parser():
                     args=  self.getArgs(end=')')
                     operand= Function(value,args)                
 
-            elif not self.end and self.current == '[':
+            elif self.isSymbol('['):
                 self.index+=1    
                 operand = self.getIndexOperand(value)              
             elif self.mgr.reInt.match(value): 
@@ -1147,32 +1764,25 @@ class Parser():
                 operand= self.getEnum(value)
             else:
                 operand = Variable(value)
-        elif char == '\'' or char == '"':
+        elif self.lexemes[self.index].kind == 'string':
+            operand= Constant(self.current)
             self.index+=1
-            result=  self.getString(char)
-            operand= Constant(result)
-        elif char == '(':
+        elif self.isSymbol('('):
             self.index+=1
             operand=  self.getExpression(_break=')') 
-        elif char == '{':
+        elif self.isSymbol('{'):
             self.index+=1
             operand = self.getObject()  
-        elif char == '[':
+        elif self.isSymbol('['):
             self.index+=1
             elements=  self.getArgs(end=']')
             operand = Array('array',elements)
 
-        if not self.end and  self.current=='.':
-            self.index+=1
-            name=  self.getValue()
-            if self.current == '(': self.index+=1
+        while self.isChild():
+            name=  self.getValue()[1:]
+            if self.isSymbol('('): self.index+=1
             operand =self.getChildFunction(name,operand)
 
-            # function= self.getOperand()
-            # function.operands.insert(0,operand)
-            # if '.' not in function.name :function.name = '.'+function.name
-            # operand=function
-
         if isNegative:operand=NegativeDecorator('-',[operand])
         if isNot:operand=NotDecorator('!',[operand])
         if isBitNot:operand=BitNot('~',[operand])  
@@ -1182,43 +1792,18 @@ class Parser():
         return self.mgr.priority(op)        
 
     def getValue(self,increment:bool=True):
-        buff=[]
-        if increment:
-            while not self.end and self.mgr.reAlphanumeric.match(self.current):
-                buff.append(self.current)
-                self.index+=1
-        else:
-            index = self.index
-            while not self.end and self.mgr.reAlphanumeric.match(self.buffer[index]):
-                buff.append(self.buffer[index])
-                index+=1        
-        return ''.join(buff)
+        if self.end or self.lexemes[self.index].kind != 'value': return ''
+        value = self.current
+        if increment: self.index+=1
+        return value
 
     def getOperator(self):
         if self.end:return None 
-        op=None
-        if self.index+2 < self.length:
-            triple = self.current+self.next+self.buffer[self.index+2]
-            if triple in self.mgr.tripleOperators :op=triple
-            # if triple in ['**=','//=','<<=','>>=']:op=triple
-        if op is None and  self.index+1 < self.length:
-            double = self.current+self.next
-            if double in self.mgr.doubleOperators  :op=double
-            # if double in ['**','//','>=','<=','!=','==','+=','-=','*=','/=','%=','&&','||','|=','^=','<<','>>']  :op=double
-        if op is None:op=self.current 
-        self.index+=len(op)
-        return op
-
-    def getString(self,char):
-        buff=[]       
-        while not self.end :
-            if self.current == char:
-                if not((self.index+1 < self.length and self.next == char) or (self.previous == char)):
-                    break 
-            buff.append(self.current)
-            self.index+=1
-        self.index+=1    
-        return ''.join(buff)
+        lexeme = self.lexemes[self.index]
+        if lexeme.kind != 'symbol':
+            raise ExpressionError('unexpected '+lexeme.value+' at position '+str(lexeme.offset))
+        self.index+=1
+        return lexeme.value
 
     def getArgs(self,end=')'):
         args= []
@@ -1232,13 +1817,12 @@ class Parser():
         attributes= []
         while True:
             name=None
-            if self.current== '"' or  self.current == "'":
-                char= self.current
+            if not self.end and self.lexemes[self.index].kind == 'string':
+                name= self.current
                 self.index+=1
-                name= self.getString(char)
             else:    
                 name= self.getValue()
-            if self.current==':':self.index+=1
+            if self.isSymbol(':'):self.index+=1
             else:raise ExpressionError('attribute '+name+' without value')
             value= self.getExpression(_break=',}')
             attribute = KeyValue(name,[value])
@@ -1259,7 +1843,7 @@ class Parser():
 
     def getIfBlock(self):
         condition= self.getExpression(_break=')')
-        if  self.current == '{':
+        if  self.isSymbol('{'):
             self.index+=1  
             block= self.getBlock()
         else:
@@ -1268,8 +1852,8 @@ class Parser():
         nextValue=self.getValue(increment=False)
         elseblock=None
         if nextValue=='else':
-            self.index+=len(nextValue)
-            if  self.current == '{':
+            self.index+=1
+            if  self.isSymbol('{'):
                 self.index+=1  
                 elseblock= self.getBlock()
             else:
@@ -1279,7 +1863,7 @@ class Parser():
 
     def getWhileBlock(self):
         condition= self.getExpression(_break=')')
-        if  self.current == '{':
+        if  self.isSymbol('{'):
             self.index+=1  
             block= self.getBlock()
         else:
@@ -1299,64 +1883,41 @@ class Parser():
             args.insert(0,parent)
             return Function('.'+name,args)
 
-        # if '.' in name:
-        #     names = name.split('.')
-        #     key = names.pop()
-        #     variableName= '.'.join(names)
-        #     variable = Variable(variableName)
-        #     if key == 'foreach': return self.getForeach(variable)
-        #     elif key == 'map': return self.getMap(variable)
-        #     elif key == 'reverse': return self.getReverse(variable)
-        #     elif key == 'first': return self.getFirst(variable)
-        #     elif key == 'last': return self.getLast(variable)
-        #     elif key == 'filter': return self.getFilter(variable)
-        #     else: 
-        #         args=  self.getArgs(end=')')
-        #         args.insert(0,variable)
-        #         return Function('.'+key,args)
-        # else:
-        #     args=  self.getArgs(end=')')
-        #     return Function(name,args)
-
     def getForeach(self,variable):
         name= self.getValue()
-        if self.current==':':self.index+=1
+        if self.isSymbol(':'):self.index+=1
         else:raise ExpressionError('foreach without body')
         body= self.getExpression(_break=')')
         return ArrayForeach(name,[variable,body]) 
 
     def getMap(self,variable):
         name= self.getValue()
-        if self.current==':':self.index+=1
+        if self.isSymbol(':'):self.index+=1
         else:raise ExpressionError('map without body')
         body= self.getExpression(_break=')')
         return ArrayMap(name,[variable,body])   
 
     def getReverse(self,variable): 
-        if self.current == ')': self.index+=1       
+        if self.isSymbol(')'): self.index+=1       
         return ArrayReverse('',[variable]) 
-        # if self.current==':':self.index+=1
-        # else:raise ExpressionError('reverse without body')
-        # body= self.getExpression(_break=')')
-        # return Reverse(name,[variable,body])   
 
     def getFirst(self,variable):
         name= self.getValue()
-        if self.current==':':self.index+=1
+        if self.isSymbol(':'):self.index+=1
         else:raise ExpressionError('first without body')
         body= self.getExpression(_break=')')
         return ArrayFirst(name,[variable,body])  
 
     def getLast(self,variable):
         name= self.getValue()
-        if self.current==':':self.index+=1
+        if self.isSymbol(':'):self.index+=1
         else:raise ExpressionError('last without body')
         body= self.getExpression(_break=')')
         return ArrayLast(name,[variable,body])                   
 
     def getFilter(self,variable):
         name= self.getValue()
-        if self.current==':':self.index+=1
+        if self.isSymbol(':'):self.index+=1
         else:raise ExpressionError('filter without body')
         body= self.getExpression(_break=')')
         return ArrayFilter(name,[variable,body])  
@@ -1383,6 +1944,2368 @@ class Parser():
                 attribute = KeyValue(name,[Constant(_value)])
                 attributes.append(attribute)
             return Object('object',attributes)
-   
 
-                            
\ No newline at end of file
+class Compiler():
+    """
+    translates an operand tree to a chain of closures.
+    Each closure receives the Context and never writes on the nodes, so the result can be reused.
+    The exception are the operands implemented by the user, solved walking the tree with the context assigned to their nodes
+    """
+    binaries = {
+        Addition:operator.add,
+        Subtraction:operator.sub,
+        Multiplication:operator.mul,
+        Division:operator.truediv,
+        Exponentiation:operator.pow,
+        FloorDivision:operator.floordiv,
+        Mod:operator.mod,
+        BitAnd:operator.and_,
+        BitOr:operator.or_,
+        BitXor:operator.xor,
+        LeftShift:operator.lshift,
+        RightShift:operator.rshift,
+        Equal:operator.eq,
+        NotEqual:operator.ne,
+        GreaterThan:operator.gt,
+        LessThan:operator.lt,
+        GreaterThanOrEqual:operator.ge,
+        LessThanOrEqual:operator.le,
+        IndexDecorator:operator.getitem
+    }
+    unaries = {
+        NegativeDecorator:lambda a: a * -1,
+        NotDecorator:operator.not_,
+        Not:operator.not_,
+        BitNot:operator.invert
+    }
+    assignments = {
+        AssigmentAddition:operator.iadd,
+        AssigmentSubtraction:operator.isub,
+        AssigmentMultiplication:operator.imul,
+        AssigmentDivision:operator.itruediv,
+        AssigmentExponentiation:operator.ipow,
+        AssigmentFloorDivision:operator.ifloordiv,
+        AssigmentMod:operator.imod,
+        AssigmentBitAnd:operator.iand,
+        AssigmentBitOr:operator.ior,
+        AssigmentBitXor:operator.ixor,
+        AssigmentLeftShift:operator.ilshift,
+        AssigmentRightShift:operator.irshift
+    }
+
+    def __init__(self,mgr):
+        self.mgr = mgr
+        self.scopes = []
+        self.methods = {
+            Constant:self.compileConstant,
+            Variable:self.compileVariable,
+            KeyValue:self.compileKeyValue,
+            Array:self.compileArray,
+            Object:self.compileObject,
+            Function:self.compileFunction,
+            Block:self.compileBlock,
+            If:self.compileIf,
+            While:self.compileWhile,
+            And:self.compileAnd,
+            Or:self.compileOr,
+            Assigment:self.compileAssigment,
+            Shared:self.compileShared,
+            ArrayForeach:self.compileForeach,
+            ArrayMap:self.compileMap,
+            ArrayFirst:self.compileFirst,
+            ArrayLast:self.compileLast,
+            ArrayFilter:self.compileFilter,
+            ArrayReverse:self.compileReverse,
+            ArraySort:self.compileSort,
+            ArrayPush:self.compilePush,
+            ArrayPop:self.compilePop,
+            ArrayRemove:self.compileRemove
+        }
+
+    def compile(self,operand:Operand):
+        if operand is None: return lambda context: None
+        _type = type(operand)
+        if _type in self.binaries: return self.compileBinary(operand,self.binaries[_type])
+        if _type in self.unaries: return self.compileUnary(operand,self.unaries[_type])
+        if _type in self.assignments: return self.compileAssigmentOperator(operand,self.assignments[_type])
+        if _type in self.methods: return self.methods[_type](operand)
+        if isinstance(operand,Operator) and _type.value is Operator.value:
+            return self.compileBinary(operand,operand.solve)
+        return self.compileTree(operand)
+
+    def compileTree(self,operand:Operand):
+        # operands implemented by the user only know how to solve themselves walking the tree,
+        # the context is assigned to their nodes, so they are the only ones that can not be solved from several threads at the same time
+        mgr = self.mgr
+        def solve(context):
+            mgr.setContext(operand,context)
+            return operand.value
+        return solve
+
+    def compileConstant(self,operand:Constant):
+        value = operand.value
+        return lambda context: value
+
+    def compileVariable(self,operand:Variable):
+        return self.compileGetter(operand.names)
+
+    def getDepth(self,name:str)->int:
+        """lambda scopes to go up to find the variable, None when the variable is read from the root context"""
+        for i in range(len(self.scopes)-1,-1,-1):
+            if self.scopes[i] == name: return len(self.scopes)-1-i
+        return None
+
+    def compileGetter(self,names:tuple):
+        # the path is split and its scope resolved once, reading the variable does not work with strings
+        depth = self.getDepth(names[0])
+        if depth is None and len(names) == 1:
+            name = names[0]
+            def getRoot(context):
+                data = context.root.data
+                return data[name] if name in data else None
+            return getRoot
+        if depth is None and len(names) == 2:
+            name,child = names
+            def getRootChild(context):
+                data = context.root.data
+                if name not in data: return None
+                data = data[name]
+                return data[child] if child in data else None
+            return getRootChild
+        if depth == 0 and len(names) == 1:
+            name = names[0]
+            return lambda context: context.data[name]
+        def get(context):
+            value = context.getScope(depth)
+            for n in names:
+                if n not in value: return None
+                value = value[n]
+            return value
+        return get
+
+    def compileSetter(self,names:tuple):
+        depth = self.getDepth(names[0])
+        parents = names[:-1]
+        name = names[-1]
+        def set(context,value):
+            data = context.getScope(depth)
+            for n in parents:
+                data = data[n]
+            data[name] = value
+        return set
+
+    def compileKeyValue(self,operand:KeyValue):
+        return self.compile(operand.operands[0])
+
+    def compileArray(self,operand:Array):
+        elements = [self.compile(p) for p in operand.operands]
+        return lambda context: [p(context) for p in elements]
+
+    def compileObject(self,operand:Object):
+        attributes = [(p.name,self.compile(p)) for p in operand.operands]
+        return lambda context: {name:p(context) for name,p in attributes}
+
+    def compileBinary(self,operand:Operator,solve):
+        operands = [self.compile(p) for p in operand.operands]
+        if len(operands) == 2:
+            a,b = operands
+            return lambda context: solve(a(context),b(context))
+        first = operands[0]
+        rest = operands[1:]
+        def reduce(context):
+            val = first(context)
+            for p in rest:
+                val = solve(val,p(context))
+            return val
+        return reduce
+
+    def compileUnary(self,operand:Operator,solve):
+        a = self.compile(operand.operands[0])
+        return lambda context: solve(a(context))
+
+    def compileAnd(self,operand:And):
+        a = self.compile(operand.operands[0])
+        b = self.compile(operand.operands[1])
+        def solve(context):
+            if not a(context): return False
+            return b(context)
+        return solve
+
+    def compileOr(self,operand:Or):
+        a = self.compile(operand.operands[0])
+        b = self.compile(operand.operands[1])
+        def solve(context):
+            if a(context): return True
+            return b(context)
+        return solve
+
+    def compileAssigment(self,operand:Assigment):
+        target = operand.operands[0]
+        if isinstance(target,IndexDecorator): return self.compileIndexAssigment(operand,None)
+        if not isinstance(target,Variable): raise ExpressionError('assignment to '+type(target).__name__+' not supported')
+        get = self.compileGetter(target.names)
+        set = self.compileSetter(target.names)
+        value = self.compile(operand.operands[1])
+        def solve(context):
+            result = value(context)
+            if context.budget is not None: context.budget.check(result)
+            set(context,result)
+            return get(context)
+        return solve
+
+    def compileAssigmentOperator(self,operand:Operator,solve):
+        target = operand.operands[0]
+        if isinstance(target,IndexDecorator): return self.compileIndexAssigment(operand,solve)
+        if not isinstance(target,Variable): raise ExpressionError('assignment to '+type(target).__name__+' not supported')
+        get = self.compileGetter(target.names)
+        set = self.compileSetter(target.names)
+        value = self.compile(operand.operands[1])
+        def assign(context):
+            result = solve(get(context),value(context))
+            if context.budget is not None: context.budget.check(result)
+            set(context,result)
+            return get(context)
+        return assign
+
+    def compileIndexAssigment(self,operand:Operator,solve):
+        # a[i] = value and a[i] += value, solved in the order of python
+        container = self.compile(operand.operands[0].operands[0])
+        index = self.compile(operand.operands[0].operands[1])
+        value = self.compile(operand.operands[1])
+        if solve is None:
+            def assign(context):
+                result = value(context)
+                if context.budget is not None: context.budget.check(result)
+                data = container(context)
+                key = index(context)
+                data[key] = result
+                return data[key]
+            return assign
+        def assignOperator(context):
+            data = container(context)
+            key = index(context)
+            result = solve(data[key],value(context))
+            if context.budget is not None: context.budget.check(result)
+            data[key] = result
+            return data[key]
+        return assignOperator
+
+    def compileFunction(self,operand:Function):
+        mgr = self.mgr
+        args = [self.compile(p) for p in operand.operands]
+        if '.' not in operand.name and operand.binding is not None:
+            binding = operand.binding
+            return lambda context: binding.function(*[p(context) for p in args])
+        if '.' not in operand.name:
+            key = operand.name
+            def call(context):
+                function = mgr.getFunction(key)
+                if function is None: raise ExpressionError('function '+key+' not found')
+                return function(*[p(context) for p in args])
+            return call
+        name = operand.name.replace('.','')
+        parent = args[0]
+        args = args[1:]
+        # inline cache of the call site: type of the last receiver, version of the functions and its method.
+        # The entry is a tuple read once and replaced whole, so another thread never mixes the type of one entry with the method of other
+        cache = [(None,None,None)]
+        def callChild(context):
+            value = parent(context)
+            entry = cache[0]
+            if type(value) is not entry[0] or mgr._version != entry[1]:
+                entry = cache[0] = (type(value),mgr._version,mgr.getMethod(name,type(value)))
+            return entry[2](value,*[p(context) for p in args])
+        return callChild
+
+    def compileShared(self,operand:Shared):
+        slot = operand.name
+        child = self.compile(operand.operands[0])
+        def solve(context):
+            memo = context.memo
+            if slot in memo: return memo[slot]
+            value = memo[slot] = child(context)
+            return value
+        return solve
+
+    def compileBlock(self,operand:Block):
+        lines = [self.compile(p) for p in operand.operands]
+        def solve(context):
+            for p in lines:
+                p(context)
+        return solve
+
+    def compileIf(self,operand:If):
+        condition = self.compile(operand.operands[0])
+        block = self.compile(operand.operands[1])
+        elseblock = self.compile(operand.operands[2]) if len(operand.operands) > 2 else None
+        def solve(context):
+            if condition(context):
+                block(context)
+            elif elseblock is not None:
+                elseblock(context)
+        return solve
+
+    def compileWhile(self,operand:While):
+        condition = self.compile(operand.operands[0])
+        block = self.compile(operand.operands[1])
+        def solve(context):
+            budget = context.budget
+            while condition(context):
+                if budget is not None: budget.step()
+                block(context)
+        return solve
+
+    def compileBody(self,operand:Operand):
+        # the body of a lambda is solved in a child context where the name of the operand is the current element
+        self.scopes.append(operand.name)
+        try:
+            return self.compile(operand.operands[1])
+        finally:
+            self.scopes.pop()
+
+    def compileSource(self,operand:Operand,consumer:Operand):
+        # a map or filter whose body has no side effects is consumed lazily by the body of the next operator of the chain,
+        # so the chain is solved in a single pass without intermediate lists and first stops at the match.
+        # The list is built first when the consumer may change what the source reads
+        if type(operand) in (ArrayMap,ArrayFilter) and self.mgr.isPure(operand.operands[1]) and self.isIndependent(operand,consumer):
+            return self.compileStream(operand)
+        return self.compile(operand)
+
+    def isIndependent(self,source:Operand,consumer:Operand)->bool:
+        if self.mgr.isPure(consumer): return True
+        writes = set()
+        if not self.getAssigned(consumer,writes): return False
+        return all(p.split('.')[0] not in writes for p in self.mgr.getVars(source))
+
+    def getAssigned(self,operand:Operand,writes:set)->bool:
+        """adds the root names of the variables assigned by the operand to writes, false if it has other side effects"""
+        if operand is None: return True
+        if isinstance(operand,Operator) and self.mgr.category(operand.name) == 'assignment':
+            if not isinstance(operand.operands[0],Variable): return False
+            writes.add(operand.operands[0].names[0])
+            return all(self.getAssigned(p,writes) for p in operand.operands[1:])
+        if isinstance(operand,Function) and ('.' in operand.name or not self.mgr.isPureFunction(operand.name)): return False
+        if isinstance(operand,(ArrayPush,ArrayPop,ArrayRemove,ArrayReverse,ArraySort,ArrayLast)): return False
+        return all(self.getAssigned(p,writes) for p in operand.operands)
+
+    def compileStream(self,operand:Operand):
+        name = operand.name
+        variable = self.compileSource(operand.operands[0],operand.operands[1])
+        body = self.compileBody(operand)
+        if type(operand) is ArrayMap:
+            def solve(context):
+                budget = context.budget
+                childContext = context.newContext()
+                for p in variable(context):
+                    if budget is not None: budget.step()
+                    childContext.init(name,p)
+                    yield body(childContext)
+        else:
+            def solve(context):
+                budget = context.budget
+                childContext = context.newContext()
+                for p in variable(context):
+                    if budget is not None: budget.step()
+                    childContext.init(name,p)
+                    if body(childContext): yield p
+        return solve
+
+    def compileForeach(self,operand:ArrayForeach):
+        name = operand.name
+        variable = self.compileSource(operand.operands[0],operand.operands[1])
+        body = self.compileBody(operand)
+        def solve(context):
+            budget = context.budget
+            childContext = context.newContext()
+            for p in variable(context):
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                body(childContext)
+        return solve
+
+    def compileMap(self,operand:ArrayMap):
+        name = operand.name
+        variable = self.compileSource(operand.operands[0],operand.operands[1])
+        body = self.compileBody(operand)
+        def solve(context):
+            result = []
+            budget = context.budget
+            childContext = context.newContext()
+            for p in variable(context):
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                result.append(body(childContext))
+            if budget is not None: budget.check(result)
+            return result
+        return solve
+
+    def compileFirst(self,operand:ArrayFirst):
+        name = operand.name
+        variable = self.compileSource(operand.operands[0],operand.operands[1])
+        body = self.compileBody(operand)
+        def solve(context):
+            budget = context.budget
+            childContext = context.newContext()
+            for p in variable(context):
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                if body(childContext): return p
+            return None
+        return solve
+
+    def compileLast(self,operand:ArrayLast):
+        name = operand.name
+        variable = self.compile(operand.operands[0])
+        body = self.compileBody(operand)
+        def solve(context):
+            budget = context.budget
+            childContext = context.newContext()
+            value = variable(context)
+            value.reverse()
+            for p in value:
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                if body(childContext): return p
+            return None
+        return solve
+
+    def compileFilter(self,operand:ArrayFilter):
+        name = operand.name
+        variable = self.compileSource(operand.operands[0],operand.operands[1])
+        body = self.compileBody(operand)
+        def solve(context):
+            result = []
+            budget = context.budget
+            childContext = context.newContext()
+            for p in variable(context):
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                if body(childContext): result.append(p)
+            if budget is not None: budget.check(result)
+            return result
+        return solve
+
+    def compileReverse(self,operand:ArrayReverse):
+        variable = self.compile(operand.operands[0])
+        if len(operand.operands) == 1:
+            def solve(context):
+                value = variable(context)
+                value.reverse()
+                return value
+            return solve
+        keys = self.compileKeys(operand)
+        def sort(context):
+            value = variable(context)
+            items = sorted(zip(keys(context,value),range(len(value))))
+            items.reverse()
+            return [value[i] for _,i in items]
+        return sort
+
+    def compileSort(self,operand:ArraySort):
+        variable = self.compile(operand.operands[0])
+        if len(operand.operands) == 1:
+            def solve(context):
+                value = variable(context)
+                value.sort()
+                return value
+            return solve
+        keys = self.compileKeys(operand)
+        def sort(context):
+            value = variable(context)
+            return [value[i] for _,i in sorted(zip(keys(context,value),range(len(value))))]
+        return sort
+
+    def compileKeys(self,operand:Operand):
+        # the key of each element is solved by the body once, the position breaks the ties without comparing the elements
+        name = operand.name
+        body = self.compileBody(operand)
+        def keys(context,value):
+            budget = context.budget
+            childContext = context.newContext()
+            result = []
+            for p in value:
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                result.append(body(childContext))
+            return result
+        return keys
+
+    def compilePush(self,operand:ArrayPush):
+        variable = self.compile(operand.operands[0])
+        element = self.compile(operand.operands[1])
+        def solve(context):
+            value = variable(context)
+            value.append(element(context))
+            if context.budget is not None: context.budget.check(value)
+            return value
+        return solve
+
+    def compilePop(self,operand:ArrayPop):
+        variable = self.compile(operand.operands[0])
+        if len(operand.operands) == 1: return lambda context: variable(context).pop()
+        index = self.compile(operand.operands[1])
+        return lambda context: variable(context).pop(index(context))
+
+    def compileRemove(self,operand:ArrayRemove):
+        variable = self.compile(operand.operands[0])
+        element = self.compile(operand.operands[1])
+        def solve(context):
+            variable(context).remove(element(context))
+        return solve
+
+class Label():
+    """position of the code that a jump refers to, resolved when the lowering ends"""
+    __slots__ = ('position',)
+    def __init__(self):
+        self.position = None
+
+class Program():
+    """
+    operand lowered to a list of instructions (opcode,argument) executed by a loop with a stack of values.
+    The program does not recurse per node, so it solves trees deeper than the recursion limit
+    """
+    names = ['CONST','LOAD','BINARY','BINARY_CONST','UNARY','STORE','STORE_OPERATOR','AND','OR','JUMP','JUMP_IF_FALSE','POP'
+            ,'BUILD_LIST','BUILD_DICT','CALL','SHARED','MEMO','CLOSURE','LOOP']
+    CONST,LOAD,BINARY,BINARY_CONST,UNARY,STORE,STORE_OPERATOR,AND,OR,JUMP,JUMP_IF_FALSE,POP,BUILD_LIST,BUILD_DICT,CALL,SHARED,MEMO,CLOSURE,LOOP = range(len(names))
+    __slots__ = ('code','mgr')
+
+    def __init__(self,mgr,code:list):
+        self.mgr = mgr
+        self.code = code
+
+    def __len__(self):
+        return len(self.code)
+
+    def __str__(self):
+        return '\n'.join('{0:>4} {1:<16}{2}'.format(i,Program.names[op],'' if arg is None else getattr(arg,'__name__',arg)) for i,(op,arg) in enumerate(self.code))
+
+    def __call__(self,context:Context):
+        # the opcodes as locals, the loop does not look up the attributes of the class
+        CONST,LOAD,BINARY,BINARY_CONST,UNARY,STORE,STORE_OPERATOR,AND,OR,JUMP,JUMP_IF_FALSE,POP,BUILD_LIST,BUILD_DICT,CALL,SHARED,MEMO,CLOSURE,LOOP = range(len(Program.names))
+        code = self.code
+        length = len(code)
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        budget = context.budget
+        pc = 0
+        while pc < length:
+            op,arg = code[pc]
+            pc += 1
+            if op == LOAD:
+                push(arg(context))
+            elif op == CONST:
+                push(arg)
+            elif op == BINARY:
+                b = pop()
+                stack[-1] = arg(stack[-1],b)
+            elif op == BINARY_CONST:
+                solve,b = arg
+                stack[-1] = solve(stack[-1],b)
+            elif op == UNARY:
+                stack[-1] = arg(stack[-1])
+            elif op == JUMP_IF_FALSE:
+                if not pop(): pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == LOOP:
+                if budget is not None: budget.step()
+                pc = arg
+            elif op == POP:
+                pop()
+            elif op == AND:
+                if not stack[-1]:
+                    stack[-1] = False
+                    pc = arg
+                else: pop()
+            elif op == OR:
+                if stack[-1]:
+                    stack[-1] = True
+                    pc = arg
+                else: pop()
+            elif op == STORE:
+                get,set = arg
+                if budget is not None: budget.check(stack[-1])
+                set(context,pop())
+                push(get(context))
+            elif op == STORE_OPERATOR:
+                get,set,solve = arg
+                value = solve(get(context),pop())
+                if budget is not None: budget.check(value)
+                set(context,value)
+                push(get(context))
+            elif op == CALL:
+                key,count = arg
+                # the calls bound carry the binding instead of the name
+                function = key.function if type(key) is Binding else self.mgr.getFunction(key)
+                if function is None: raise ExpressionError('function '+str(key)+' not found')
+                if count:
+                    args = stack[-count:]
+                    del stack[-count:]
+                    push(function(*args))
+                else:
+                    push(function())
+            elif op == BUILD_LIST:
+                if arg:
+                    values = stack[-arg:]
+                    del stack[-arg:]
+                    push(values)
+                else:
+                    push([])
+            elif op == BUILD_DICT:
+                if arg:
+                    values = stack[-len(arg):]
+                    del stack[-len(arg):]
+                    push(dict(zip(arg,values)))
+                else:
+                    push({})
+            elif op == SHARED:
+                slot,target = arg
+                if slot in context.memo:
+                    push(context.memo[slot])
+                    pc = target
+            elif op == MEMO:
+                context.memo[arg] = stack[-1]
+            else:
+                push(arg(context))
+        return pop()
+
+class StackCompiler():
+    """
+    lowers the operand to a Program walking the tree with an explicit stack instead of recursion.
+    The lambdas of the arrays and the operands implemented by the user are delegated to the closures of the Compiler
+    """
+    def __init__(self,mgr):
+        self.mgr = mgr
+        self.closures = Compiler(mgr)
+
+    def compile(self,operand:Operand)->Program:
+        code = []
+        pending = [operand]
+        while pending:
+            item = pending.pop()
+            if isinstance(item,Label):
+                item.position = len(code)
+            elif isinstance(item,tuple):
+                code.append(item)
+            else:
+                pending.extend(reversed(self.lower(item)))
+        return Program(self.mgr,[(op,self.resolve(arg)) for op,arg in code])
+
+    def resolve(self,arg):
+        if isinstance(arg,Label): return arg.position
+        if isinstance(arg,tuple): return tuple(p.position if isinstance(p,Label) else p for p in arg)
+        return arg
+
+    def lower(self,operand:Operand)->list:
+        """returns the items that solve the operand: operands to lower, instructions or labels"""
+        if operand is None: return [(Program.CONST,None)]
+        _type = type(operand)
+        closures = self.closures
+        if _type is Constant: return [(Program.CONST,operand.value)]
+        if _type is Variable: return [(Program.LOAD,closures.compileGetter(operand.names))]
+        if _type in Compiler.binaries: return self.lowerBinary(operand,Compiler.binaries[_type])
+        if _type in Compiler.unaries: return [operand.operands[0],(Program.UNARY,Compiler.unaries[_type])]
+        if _type in Compiler.assignments or _type is Assigment:
+            target = operand.operands[0]
+            if isinstance(target,Variable):
+                get = closures.compileGetter(target.names)
+                set = closures.compileSetter(target.names)
+                if _type is Assigment: return [operand.operands[1],(Program.STORE,(get,set))]
+                return [operand.operands[1],(Program.STORE_OPERATOR,(get,set,Compiler.assignments[_type]))]
+        elif _type is And or _type is Or:
+            end = Label()
+            return [operand.operands[0],(Program.AND if _type is And else Program.OR,end),operand.operands[1],end]
+        elif _type is KeyValue:
+            return [operand.operands[0]]
+        elif _type is Array:
+            return list(operand.operands)+[(Program.BUILD_LIST,len(operand.operands))]
+        elif _type is Object:
+            return list(operand.operands)+[(Program.BUILD_DICT,tuple(p.name for p in operand.operands))]
+        elif _type is Function and '.' not in operand.name:
+            return list(operand.operands)+[(Program.CALL,(operand.binding or operand.name,len(operand.operands)))]
+        elif _type is Shared:
+            end = Label()
+            return [(Program.SHARED,(operand.name,end)),operand.operands[0],(Program.MEMO,operand.name),end]
+        elif _type is Block:
+            items = []
+            for p in operand.operands:
+                items.extend([p,(Program.POP,None)])
+            return items+[(Program.CONST,None)]
+        elif _type is If:
+            elseblock,end = Label(),Label()
+            items = [operand.operands[0],(Program.JUMP_IF_FALSE,elseblock),operand.operands[1],(Program.POP,None),(Program.JUMP,end),elseblock]
+            if len(operand.operands) > 2 and operand.operands[2] is not None:
+                items.extend([operand.operands[2],(Program.POP,None)])
+            return items+[end,(Program.CONST,None)]
+        elif _type is While:
+            start,end = Label(),Label()
+            return [start,operand.operands[0],(Program.JUMP_IF_FALSE,end),operand.operands[1],(Program.POP,None),(Program.LOOP,start),end,(Program.CONST,None)]
+        elif isinstance(operand,Operator) and _type.value is Operator.value:
+            return self.lowerBinary(operand,operand.solve)
+        return [(Program.CLOSURE,closures.compile(operand))]
+
+    def lowerBinary(self,operand:Operator,solve)->list:
+        items = [operand.operands[0]]
+        for p in operand.operands[1:]:
+            # a constant operand travels with the instruction instead of through the stack
+            if type(p) is Constant: items.append((Program.BINARY_CONST,(solve,p.value)))
+            else: items.extend([p,(Program.BINARY,solve)])
+        return items
+
+class AsyncFunction():
+    """coroutine function that solves an operand with a Context, compiled for the version of the functions added"""
+    __slots__ = ('solve','version')
+    def __init__(self,solve,version:int):
+        self.solve = solve
+        self.version = version
+
+    def __call__(self,context:Context):
+        return self.solve(context)
+
+class AsyncCompiler():
+    """
+    translates an operand tree to coroutine functions for Exp.evalAsync.
+    Only the operands that call a coroutine function are awaited, the rest are solved by the closures of the Compiler.
+    The arguments and the elements of map and filter are solved concurrently only when they have no side effects
+    other than the coroutine calls, otherwise they are solved one at a time in order
+    """
+    def __init__(self,mgr):
+        self.mgr = mgr
+        self.closures = Compiler(mgr)
+        # the lambda scopes are shared, the closures of a body resolve the variables of the element
+        self.scopes = self.closures.scopes
+        self.awaited = set()
+        self.methods = {
+            KeyValue:self.compileKeyValue,
+            Array:self.compileArray,
+            Object:self.compileObject,
+            Function:self.compileFunction,
+            Block:self.compileBlock,
+            If:self.compileIf,
+            While:self.compileWhile,
+            And:self.compileAnd,
+            Or:self.compileOr,
+            Assigment:self.compileAssigment,
+            Shared:self.compileShared,
+            ArrayForeach:self.compileForeach,
+            ArrayMap:self.compileMap,
+            ArrayFirst:self.compileFirst,
+            ArrayLast:self.compileLast,
+            ArrayFilter:self.compileFilter
+        }
+
+    def compile(self,operand:Operand)->AsyncFunction:
+        self.awaited = self.findAwaited(operand)
+        return AsyncFunction(self.compileAsync(operand),self.mgr._version)
+
+    def findAwaited(self,operand:Operand)->set:
+        """ids of the operands that call a coroutine function or contain one that does"""
+        awaited = set()
+        order = []
+        pending = [(operand,None)]
+        while pending:
+            p,parent = pending.pop()
+            if p is None: continue
+            order.append((p,parent))
+            pending.extend((child,p) for child in p.operands)
+        for p,parent in reversed(order):
+            if id(p) in awaited or (isinstance(p,Function) and self.mgr.isAsyncFunction(p.name.replace('.',''))):
+                awaited.add(id(p))
+                if parent is not None: awaited.add(id(parent))
+        return awaited
+
+    def compileAsync(self,operand:Operand):
+        if operand is None or id(operand) not in self.awaited:
+            function = self.closures.compile(operand)
+            async def solve(context):
+                return function(context)
+            return solve
+        _type = type(operand)
+        if _type in Compiler.binaries: return self.compileOperator(operand,Compiler.binaries[_type])
+        if _type in Compiler.unaries: return self.compileOperator(operand,Compiler.unaries[_type])
+        if _type in Compiler.assignments: return self.compileAssigmentOperator(operand,Compiler.assignments[_type])
+        if _type in self.methods: return self.methods[_type](operand)
+        if isinstance(operand,Operator) and _type.value is Operator.value:
+            return self.compileOperator(operand,operand.solve)
+        raise ExpressionError('operand '+_type.__name__+' with coroutine functions is not supported by evalAsync')
+
+    def hasEffects(self,operand:Operand)->bool:
+        """indicates if solving the operand assigns variables, changes values in place or calls impure functions that are not coroutines"""
+        if operand is None: return False
+        if isinstance(operand,(ArrayPush,ArrayPop,ArrayRemove,ArrayReverse,ArraySort,ArrayLast)): return True
+        if isinstance(operand,Operator) and self.mgr.category(operand.name) == 'assignment': return True
+        if isinstance(operand,Function) and not self.mgr.isAsyncFunction(operand.name.replace('.','')):
+            if '.' in operand.name or not self.mgr.isPureFunction(operand.name): return True
+        return any(self.hasEffects(p) for p in operand.operands)
+
+    def compileArgs(self,operands:list):
+        """
+        coroutine function that returns the values of the operands, the ones that are awaited are solved concurrently
+        when no operand has side effects, otherwise all are solved in order
+        """
+        parts = [(id(p) in self.awaited,self.compileAsync(p) if id(p) in self.awaited else self.closures.compile(p)) for p in operands]
+        if any(self.hasEffects(p) for p in operands):
+            async def inOrder(context):
+                return [await p(context) if awaited else p(context) for awaited,p in parts]
+            return inOrder
+        async def solve(context):
+            values = []
+            awaitables = []
+            indexes = []
+            for i,(awaited,p) in enumerate(parts):
+                if awaited:
+                    awaitables.append(p(context))
+                    indexes.append(i)
+                    values.append(None)
+                else:
+                    values.append(p(context))
+            for i,value in zip(indexes,await asyncio.gather(*awaitables)):
+                values[i] = value
+            return values
+        return solve
+
+    def compileOperator(self,operand:Operator,solve):
+        args = self.compileArgs(operand.operands)
+        if len(operand.operands) == 1:
+            async def unary(context):
+                values = await args(context)
+                return solve(values[0])
+            return unary
+        async def reduce(context):
+            values = await args(context)
+            value = values[0]
+            for p in values[1:]:
+                value = solve(value,p)
+            return value
+        return reduce
+
+    def compileKeyValue(self,operand:KeyValue):
+        return self.compileAsync(operand.operands[0])
+
+    def compileArray(self,operand:Array):
+        return self.compileArgs(operand.operands)
+
+    def compileObject(self,operand:Object):
+        names = [p.name for p in operand.operands]
+        args = self.compileArgs(operand.operands)
+        async def solve(context):
+            return dict(zip(names,await args(context)))
+        return solve
+
+    def compileFunction(self,operand:Function):
+        mgr = self.mgr
+        args = self.compileArgs(operand.operands)
+        if '.' not in operand.name:
+            key = operand.name
+            binding = operand.binding
+            async def call(context):
+                function = binding.function if binding is not None else mgr.getFunction(key)
+                if function is None: raise ExpressionError('function '+key+' not found')
+                value = function(*await args(context))
+                return await value if inspect.isawaitable(value) else value
+            return call
+        name = operand.name.replace('.','')
+        async def callChild(context):
+            values = await args(context)
+            value = mgr.getMethod(name,type(values[0]))(*values)
+            return await value if inspect.isawaitable(value) else value
+        return callChild
+
+    def compileAnd(self,operand:And):
+        a = self.compileAsync(operand.operands[0])
+        b = self.compileAsync(operand.operands[1])
+        async def solve(context):
+            if not await a(context): return False
+            return await b(context)
+        return solve
+
+    def compileOr(self,operand:Or):
+        a = self.compileAsync(operand.operands[0])
+        b = self.compileAsync(operand.operands[1])
+        async def solve(context):
+            if await a(context): return True
+            return await b(context)
+        return solve
+
+    def compileAssigment(self,operand:Assigment):
+        target = operand.operands[0]
+        if not isinstance(target,Variable): raise ExpressionError('assignment with coroutine functions to '+type(target).__name__+' is not supported by evalAsync')
+        get = self.closures.compileGetter(target.names)
+        set = self.closures.compileSetter(target.names)
+        value = self.compileAsync(operand.operands[1])
+        async def solve(context):
+            result = await value(context)
+            if context.budget is not None: context.budget.check(result)
+            set(context,result)
+            return get(context)
+        return solve
+
+    def compileAssigmentOperator(self,operand:Operator,solve):
+        target = operand.operands[0]
+        if not isinstance(target,Variable): raise ExpressionError('assignment with coroutine functions to '+type(target).__name__+' is not supported by evalAsync')
+        get = self.closures.compileGetter(target.names)
+        set = self.closures.compileSetter(target.names)
+        value = self.compileAsync(operand.operands[1])
+        async def assign(context):
+            result = solve(get(context),await value(context))
+            if context.budget is not None: context.budget.check(result)
+            set(context,result)
+            return get(context)
+        return assign
+
+    def compileShared(self,operand:Shared):
+        # the memo keeps the task, the operands that share the value while it is pending await the same task
+        slot = operand.name
+        child = self.compileAsync(operand.operands[0])
+        async def solve(context):
+            memo = context.memo
+            if slot not in memo: memo[slot] = asyncio.ensure_future(child(context))
+            return await memo[slot]
+        return solve
+
+    def compileBlock(self,operand:Block):
+        lines = [self.compileAsync(p) for p in operand.operands]
+        async def solve(context):
+            for p in lines:
+                await p(context)
+        return solve
+
+    def compileIf(self,operand:If):
+        condition = self.compileAsync(operand.operands[0])
+        block = self.compileAsync(operand.operands[1])
+        elseblock = self.compileAsync(operand.operands[2]) if len(operand.operands) > 2 else None
+        async def solve(context):
+            if await condition(context):
+                await block(context)
+            elif elseblock is not None:
+                await elseblock(context)
+        return solve
+
+    def compileWhile(self,operand:While):
+        condition = self.compileAsync(operand.operands[0])
+        block = self.compileAsync(operand.operands[1])
+        async def solve(context):
+            budget = context.budget
+            while await condition(context):
+                if budget is not None: budget.step()
+                await block(context)
+        return solve
+
+    def compileBody(self,operand:Operand):
+        self.scopes.append(operand.name)
+        try:
+            return self.compileAsync(operand.operands[1])
+        finally:
+            self.scopes.pop()
+
+    def compileMap(self,operand:ArrayMap):
+        # each element is solved in its own child context, so the bodies without side effects run concurrently
+        name = operand.name
+        variable = self.compileAsync(operand.operands[0])
+        elements = self.compileElements(operand)
+        async def solve(context):
+            budget = context.budget
+            contexts = []
+            for p in await variable(context):
+                childContext = context.newContext()
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                contexts.append(childContext)
+            result = await elements(contexts)
+            if budget is not None: budget.check(result)
+            return result
+        return solve
+
+    def compileElements(self,operand:Operand):
+        """coroutine function that solves the body of the lambda for the contexts of the elements"""
+        body = self.compileBody(operand)
+        if self.hasEffects(operand.operands[1]):
+            # the writes of the elements would interleave
+            async def inOrder(contexts):
+                return [await body(p) for p in contexts]
+            return inOrder
+        async def concurrent(contexts):
+            return list(await asyncio.gather(*[body(p) for p in contexts]))
+        return concurrent
+
+    def compileFilter(self,operand:ArrayFilter):
+        name = operand.name
+        variable = self.compileAsync(operand.operands[0])
+        elements = self.compileElements(operand)
+        async def solve(context):
+            items = list(await variable(context))
+            budget = context.budget
+            contexts = []
+            for p in items:
+                childContext = context.newContext()
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                contexts.append(childContext)
+            conditions = await elements(contexts)
+            result = [p for p,condition in zip(items,conditions) if condition]
+            if budget is not None: budget.check(result)
+            return result
+        return solve
+
+    def compileFirst(self,operand:ArrayFirst):
+        name = operand.name
+        variable = self.compileAsync(operand.operands[0])
+        body = self.compileBody(operand)
+        async def solve(context):
+            budget = context.budget
+            childContext = context.newContext()
+            for p in await variable(context):
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                if await body(childContext): return p
+            return None
+        return solve
+
+    def compileLast(self,operand:ArrayLast):
+        name = operand.name
+        variable = self.compileAsync(operand.operands[0])
+        body = self.compileBody(operand)
+        async def solve(context):
+            budget = context.budget
+            childContext = context.newContext()
+            value = await variable(context)
+            value.reverse()
+            for p in value:
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                if await body(childContext): return p
+            return None
+        return solve
+
+    def compileForeach(self,operand:ArrayForeach):
+        name = operand.name
+        variable = self.compileAsync(operand.operands[0])
+        body = self.compileBody(operand)
+        async def solve(context):
+            budget = context.budget
+            childContext = context.newContext()
+            for p in await variable(context):
+                if budget is not None: budget.step()
+                childContext.init(name,p)
+                await body(childContext)
+        return solve
+
+class NodeProfile():
+    """measures of an operand in a profile, the times are in seconds"""
+    __slots__ = ('path','type','name','calls','total','own')
+    def __init__(self,path:tuple,type:str,name:str):
+        self.path = path
+        self.type = type
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.own = 0.0
+
+    @property
+    def label(self)->str:
+        return ('/'.join(map(str,self.path)) or '/')+' '+self.type+':'+str(self.name)
+
+class Profile():
+    """calls, total and self time by node (keyed by the path of getOperandByPath) and by function, and the self time by stack of nodes"""
+    def __init__(self):
+        self.evaluations = 0
+        self.nodes = {}
+        self.stacks = {}
+
+    def functions(self)->dict:
+        """measures of the functions called, adding the calls of all the nodes of the function"""
+        functions = {}
+        for p in self.nodes.values():
+            if p.type != 'Function': continue
+            name = p.name.replace('.','')
+            item = functions.setdefault(name,{'calls':0,'total':0.0,'self':0.0})
+            item['calls'] += p.calls
+            item['total'] += p.total
+            item['self'] += p.own
+        return functions
+
+    def report(self,limit:int=None)->str:
+        """text with the nodes sorted by self time"""
+        nodes = sorted(self.nodes.values(),key=lambda p: p.own,reverse=True)[:limit]
+        lines = ['{0} evaluations'.format(self.evaluations),'{0:>10} {1:>12} {2:>12}  {3}'.format('calls','total ms','self ms','node')]
+        for p in nodes:
+            lines.append('{0:>10} {1:>12.3f} {2:>12.3f}  {3}'.format(p.calls,p.total*1000,p.own*1000,p.label))
+        functions = self.functions()
+        if functions:
+            lines.append('{0:>10} {1:>12} {2:>12}  {3}'.format('calls','total ms','self ms','function'))
+            for name,p in sorted(functions.items(),key=lambda p: p[1]['total'],reverse=True):
+                lines.append('{0:>10} {1:>12.3f} {2:>12.3f}  {3}'.format(p['calls'],p['total']*1000,p['self']*1000,name))
+        return '\n'.join(lines)
+
+    def collapsed(self)->str:
+        """collapsed stacks with the self time in microseconds, the input of flamegraph.pl or speedscope"""
+        lines = []
+        for stack,value in self.stacks.items():
+            micro = int(value * 1000000)
+            if micro > 0: lines.append(';'.join(p.label.replace(';',',') for p in stack)+' '+str(micro))
+        return '\n'.join(lines)
+
+class ProfileCompiler(Compiler):
+    """compiler whose closures measure the time of each node, a stack of the running nodes separates the self time"""
+    def __init__(self,mgr,profile:Profile):
+        Compiler.__init__(self,mgr)
+        self.profile = profile
+        self.paths = {}
+        # node and time of the children of each node running
+        self.frames = []
+
+    def compile(self,operand:Operand):
+        if operand is None: return Compiler.compile(self,operand)
+        if not self.paths: self.paths = self.getPaths(operand)
+        function = Compiler.compile(self,operand)
+        path = self.paths.get(id(operand),())
+        node = self.profile.nodes.get(path)
+        if node is None: node = self.profile.nodes[path] = NodeProfile(path,type(operand).__name__,operand.name)
+        stacks = self.profile.stacks
+        frames = self.frames
+        clock = t.perf_counter
+        def measure(context):
+            frame = [node,0.0]
+            frames.append(frame)
+            start = clock()
+            try:
+                return function(context)
+            finally:
+                elapsed = clock() - start
+                frames.pop()
+                own = elapsed - frame[1]
+                node.calls += 1
+                node.total += elapsed
+                node.own += own
+                stack = tuple(p[0] for p in frames) + (node,)
+                stacks[stack] = stacks.get(stack,0.0) + own
+                if frames: frames[-1][1] += elapsed
+        return measure
+
+    def compileSource(self,operand:Operand,consumer:Operand):
+        # the lazy chains would measure the bodies inside the operator that consumes them
+        return self.compile(operand)
+
+    def getPaths(self,operand:Operand)->dict:
+        paths = {}
+        pending = [(operand,())]
+        while pending:
+            p,path = pending.pop()
+            if p is None or id(p) in paths: continue
+            paths[id(p)] = path
+            pending.extend((child,path+(i,)) for i,child in enumerate(p.operands))
+        return paths
+
+class Sampler():
+    """evaluates an operand with its compiled function, and one of every so many evaluations with the closures of a profile"""
+    def __init__(self,mgr,operand:Operand,every:int):
+        if every < 1: raise ExpressionError('every must be greater than 0')
+        self.mgr = mgr
+        self.operand = operand
+        self.every = every
+        self.count = 0
+        self.profile = Profile()
+        self.measured = ProfileCompiler(mgr,self.profile).compile(operand)
+
+    def __call__(self,context:dict={}):
+        self.count += 1
+        if self.count % self.every: return self.mgr.eval(self.operand,context)
+        self.profile.evaluations += 1
+        return self.measured(Context(context))
+
+class Batch():
+    """
+    columns of a vectorized evaluation.
+    The rows are only built when some operand has to be solved row by row
+    """
+    sequences = (list,tuple) if np is None else (list,tuple,np.ndarray)
+
+    def __init__(self,columns:dict):
+        self.columns = columns
+        self.length = self.getLength(columns)
+        self._rows = None
+
+    def getLength(self,columns:dict)->int:
+        for value in columns.values():
+            if isinstance(value,dict):
+                length = self.getLength(value)
+                if length is not None: return length
+            elif isinstance(value,self.sequences):
+                return len(value)
+        return None
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = [self.row(self.columns,i) for i in range(self.length)]
+        return self._rows
+
+    def row(self,columns:dict,index:int)->dict:
+        row = {}
+        for key,value in columns.items():
+            if isinstance(value,dict): value = self.row(value,index)
+            elif np is not None and isinstance(value,np.ndarray): value = value.item(index)
+            elif isinstance(value,self.sequences): value = value[index]
+            if '.' in key:
+                names = key.split('.')
+                parent = row
+                for name in names[:-1]:
+                    parent = parent.setdefault(name,{})
+                parent[names[-1]] = value
+            else:
+                row[key] = value
+        return row
+
+    def variable(self,name:str):
+        if name in self.columns:
+            value = self.columns[name]
+        else:
+            value = self.columns
+            for p in name.split('.'):
+                if not isinstance(value,dict) or p not in value: return None
+                value = value[p]
+        if isinstance(value,(list,tuple)): return self.array(value)
+        return value
+
+    def array(self,values):
+        if isinstance(values,np.ndarray): return values
+        _types = set(type(p) for p in values)
+        _type = _types.pop() if len(_types) == 1 else None
+        # the integers out of int64 would be converted to float or uint64
+        if _type is int and (min(values) < -2**63 or max(values) > 2**63-1): _type = None
+        if _type in (bool,int,float,str):
+            try:
+                return np.array(values)
+            except OverflowError:
+                pass
+        array = np.empty(len(values),dtype=object)
+        for i,p in enumerate(values):
+            array[i] = p
+        return array
+
+    def broadcast(self,value):
+        if isinstance(value,np.ndarray) and value.ndim == 1: return value
+        if isinstance(value,(bool,int,float,str)): return np.full(self.length,value)
+        array = np.empty(self.length,dtype=object)
+        for i in range(self.length):
+            array[i] = value
+        return array
+
+class Vectorizer():
+    """
+    translates an operand tree to closures that solve all the rows of a Batch at once with numpy.
+    Operands without a vectorized equivalent, or whose vectorized result would differ from python 
+    (errors, overflows, types), are solved row by row with the closures of the Compiler.
+    An operand with side effects, impure functions included, is solved entirely row by row, 
+    so its effects run once per row and only where eval runs them
+    """
+    arithmetics = {
+        Addition:operator.add,
+        Subtraction:operator.sub,
+        Multiplication:operator.mul,
+        Division:operator.truediv,
+        Exponentiation:operator.pow,
+        FloorDivision:operator.floordiv,
+        Mod:operator.mod,
+        LeftShift:operator.lshift,
+        RightShift:operator.rshift
+    }
+    comparisons = {
+        Equal:operator.eq,
+        NotEqual:operator.ne,
+        GreaterThan:operator.gt,
+        LessThan:operator.lt,
+        GreaterThanOrEqual:operator.ge,
+        LessThanOrEqual:operator.le,
+        BitAnd:operator.and_,
+        BitOr:operator.or_,
+        BitXor:operator.xor
+    }
+    effects = (Block,If,While,ArrayForeach,ArrayPush,ArrayPop,ArrayRemove,ArrayReverse,ArraySort,ArrayLast)
+
+    def __init__(self,mgr):
+        self.mgr = mgr
+        self.compiler = Compiler(mgr)
+        self.ufuncs = {
+            math.sin:np.sin,math.cos:np.cos,math.tan:np.tan,
+            math.asin:np.arcsin,math.acos:np.arccos,math.atan:np.arctan,math.atan2:np.arctan2,
+            math.sinh:np.sinh,math.cosh:np.cosh,math.tanh:np.tanh,
+            math.asinh:np.arcsinh,math.acosh:np.arccosh,math.atanh:np.arctanh,
+            math.exp:np.exp,math.expm1:np.expm1,math.log1p:np.log1p,math.log2:np.log2,math.log10:np.log10,
+            math.sqrt:np.sqrt,math.hypot:np.hypot,math.degrees:np.degrees,math.radians:np.radians,
+            math.copysign:np.copysign,math.fmod:np.fmod,math.ldexp:np.ldexp,
+            math.isnan:np.isnan,math.isfinite:np.isfinite,
+            math.pow:lambda a,b: np.power(np.asarray(a,dtype=float),b),
+            math.log:lambda a,base=None: np.log(a) if base is None else np.log(a)/np.log(base),
+            math.floor:lambda a: self.integer(np.floor(a)),
+            math.ceil:lambda a: self.integer(np.ceil(a)),
+            math.trunc:lambda a: self.integer(np.trunc(a))
+        }
+
+    def hasEffects(self,operand:Operand)->bool:
+        if operand is None: return False
+        if isinstance(operand,self.effects): return True
+        if isinstance(operand,Operator) and self.mgr.category(operand.name) == 'assignment': return True
+        if isinstance(operand,Function) and ('.' in operand.name or not self.mgr.isPureFunction(operand.name)): return True
+        for p in operand.operands:
+            if self.hasEffects(p): return True
+        return False
+
+    def isVectorized(self,operand:Operand)->bool:
+        """indicates if compile solves the operand without falling back row by row"""
+        _type = type(operand)
+        if _type in (Constant,Variable): return True
+        if _type is Function:
+            if '.' in operand.name or self.mgr.getFunction(operand.name) not in self.ufuncs: return False
+        elif _type not in self.arithmetics and _type not in self.comparisons and _type not in (Shared,NegativeDecorator,BitNot,Not,NotDecorator,And,Or):
+            return False
+        return all(self.isVectorized(p) for p in operand.operands)
+
+    def vectorize(self,operand:Operand):
+        if self.hasEffects(operand): return self.rowByRow(operand)
+        return self.compile(operand)
+
+    def compile(self,operand:Operand):
+        _type = type(operand)
+        if _type is Constant:
+            value = operand.value
+            return lambda batch: value
+        if _type is Variable:
+            name = operand.name
+            return lambda batch: batch.variable(name)
+        if _type is Shared: return self.compile(operand.operands[0])
+        if _type in self.arithmetics: return self.compileOperator(operand,self.checked(self.arithmetics[_type]),self.promote)
+        if _type in self.comparisons: return self.compileOperator(operand,self.comparisons[_type],lambda a: a)
+        if _type is NegativeDecorator:
+            multiply = self.checked(operator.mul)
+            return self.compileOperator(operand,lambda a: multiply(a,-1),self.promote)
+        if _type is BitNot: return self.compileOperator(operand,operator.invert,self.promote)
+        if _type in (Not,NotDecorator): return self.compileOperator(operand,lambda a: ~a if isinstance(a,np.ndarray) else not a,self.truth)
+        if _type in (And,Or):
+            # the rows short-circuited by the left operand do not solve the right one, a right operand
+            # that is solved row by row would be solved for all of them
+            if not self.isVectorized(operand.operands[1]): return self.rowByRow(operand)
+            return self.compileOperator(operand,self.both if _type is And else self.either,lambda a: a,guard=True)
+        if _type is Function and '.' not in operand.name:
+            function = self.mgr.getFunction(operand.name)
+            if function in self.ufuncs:
+                return self.compileOperator(operand,self.ufuncs[function],self.promote,reduce=False)
+        return self.rowByRow(operand)
+
+    def compileOperator(self,operand:Operator,solve,convert,reduce:bool=True,guard:bool=False):
+        """
+        the operator is solved row by row when its vectorized operation fails, from the values of its operands 
+        so they are not solved again. The errors of the operands are raised, they have already been solved row by row, 
+        except with guard (and, or) where the whole operator is solved row by row because the rows short-circuited may not raise them
+        """
+        operands = [self.compile(p) for p in operand.operands]
+        fallback = self.rowByRow(operand) if guard else self.rowByValues(operand)
+        def vectorized(batch):
+            try:
+                values = [p(batch) for p in operands]
+            except Exception:
+                if not guard: raise
+                return fallback(batch)
+            try:
+                converted = [convert(p) for p in values]
+                with np.errstate(all='raise'):
+                    if not reduce or len(converted) == 1: return solve(*converted)
+                    val = converted[0]
+                    for p in converted[1:]:
+                        val = solve(val,p)
+                    return val
+            except Exception:
+                return fallback(batch) if guard else fallback(batch,values)
+        return vectorized
+
+    def rowByRow(self,operand:Operand):
+        function = self.compiler.compile(operand)
+        return lambda batch: batch.array([function(Context(row)) for row in batch.rows])
+
+    def rowByValues(self,operand:Operator):
+        """solves the operator row by row with python from the values of its operands"""
+        _type = type(operand)
+        if _type is Function:
+            solve = self.mgr.getFunction(operand.name)
+        elif _type in Compiler.unaries:
+            solve = Compiler.unaries[_type]
+        else:
+            binary = Compiler.binaries[_type]
+            def solve(*args):
+                value = args[0]
+                for p in args[1:]:
+                    value = binary(value,p)
+                return value
+        def fallback(batch,values):
+            columns = [p.tolist() if isinstance(p,np.ndarray) else [p.item() if isinstance(p,np.generic) else p]*batch.length for p in values]
+            return batch.array([solve(*args) for args in zip(*columns)])
+        return fallback
+
+    def checked(self,solve):
+        """operation that raises OverflowError when its integer result may not fit in int64, numpy would wrap it"""
+        def check(a,b):
+            if self.overflows(solve,a,b): raise OverflowError('integer overflow')
+            return solve(a,b)
+        return check
+
+    def overflows(self,solve,a,b)->bool:
+        # the limits of the result are computed with the python integers from the limits of the operands
+        if not isinstance(a,(np.ndarray,np.integer)) and not isinstance(b,(np.ndarray,np.integer)): return False
+        a,b = self.bounds(a),self.bounds(b)
+        if a is None or b is None: return False
+        low,high = -2**63,2**63-1
+        if solve in (operator.add,operator.sub,operator.mul):
+            values = [solve(x,y) for x in a for y in b]
+            return min(values) < low or max(values) > high
+        if solve in (operator.floordiv,operator.mod): return a[0] == low and b[0] <= -1 <= b[1]
+        top = max(abs(a[0]),abs(a[1]))
+        if solve is operator.pow: return b[0] < 0 or (top > 1 and top.bit_length() * b[1] > 63)
+        if solve is operator.lshift: return b[0] < 0 or (top > 0 and top.bit_length() + b[1] > 63)
+        if solve is operator.rshift: return b[0] < 0
+        return False
+
+    def bounds(self,value)->tuple:
+        """minimum and maximum of an integer value or array, None for the other types and the empty arrays"""
+        if isinstance(value,np.ndarray):
+            if value.dtype.kind not in 'iu' or value.size == 0: return None
+            return (int(value.min()),int(value.max()))
+        if isinstance(value,(int,np.integer)) and not isinstance(value,bool): return (int(value),int(value))
+        return None
+
+    def promote(self,value):
+        # python promotes the booleans to int in arithmetic, numpy keeps them boolean
+        if isinstance(value,np.ndarray) and value.dtype == bool: return value.astype(np.int64)
+        if isinstance(value,bool): return int(value)
+        return value
+
+    def truth(self,value):
+        if not isinstance(value,np.ndarray): return bool(value)
+        if value.dtype == bool: return value
+        if value.dtype.kind in 'iufc': return value != 0
+        if value.dtype.kind == 'U': return np.char.str_len(value) > 0
+        return np.array([bool(p) for p in value],dtype=bool)
+
+    def both(self,a,b):
+        if not isinstance(a,np.ndarray) and not isinstance(b,np.ndarray): return b if a else False
+        a = self.truth(a)
+        if isinstance(b,(bool,np.ndarray)) and np.asarray(b).dtype == bool: return np.logical_and(a,b)
+        return np.where(a,np.asarray(b,dtype=object),False)
+
+    def either(self,a,b):
+        if not isinstance(a,np.ndarray) and not isinstance(b,np.ndarray): return True if a else b
+        a = self.truth(a)
+        if isinstance(b,(bool,np.ndarray)) and np.asarray(b).dtype == bool: return np.logical_or(a,b)
+        return np.where(a,True,np.asarray(b,dtype=object))
+
+    def integer(self,value):
+        if not np.all(np.isfinite(value)): raise ValueError('cannot convert to integer')
+        if np.any(np.abs(value) >= 2**63): raise OverflowError('integer overflow')
+        return value.astype(np.int64)
+
+class Optimizer():
+    """
+    returns a new operand tree with the constants propagated, the chained operators flattened in n-ary operators, 
+    the numeric constants of commutative operators reassociated and the identity elements removed.
+    Reassociation assumes numeric operands, with float operands the result may differ in the last digit.
+    The identity elements and x&0 are only removed when the other operands are known to be numbers, 
+    numeric constants or arithmetic operators of numbers, or when numeric indicates that the variables are numbers
+    """
+    associatives = (Addition,Multiplication,BitAnd,BitOr,BitXor)
+    identities = {Addition:0,Subtraction:0,Multiplication:1,Exponentiation:1,BitOr:0,BitXor:0,LeftShift:0,RightShift:0}
+    bitwises = (BitOr,BitXor,LeftShift,RightShift)
+    commutatives = (Addition,Multiplication,BitOr,BitXor)
+    negations = (Not,NotDecorator)
+    # the operators that return an int when their operands are int
+    integers = (Addition,Subtraction,Multiplication,FloorDivision,Mod,BitAnd,BitOr,BitXor,LeftShift,RightShift,NegativeDecorator,BitNot)
+
+    def __init__(self,mgr,numeric:bool=False):
+        self.mgr = mgr
+        self.numeric = numeric
+        self.compiler = Compiler(mgr)
+
+    def optimize(self,operand:Operand,truthy:bool=False)->Operand:
+        """truthy indicates that only the truth value of the operand is used"""
+        if operand is None: return None
+        operands = [self.optimize(p,self.isTruthy(operand,i,truthy)) for i,p in enumerate(operand.operands)]
+        if isinstance(operand,Operator) and self.mgr.category(operand.name) != 'assignment':
+            return self.optimizeOperator(operand,operands,truthy)
+        result = type(operand)(operand.name,operands)
+        # a coroutine is only solved by evalAsync, its calls can be shared but not folded
+        if isinstance(result,Function) and self.mgr.isPure(result) and not self.mgr.isAsyncFunction(result.name): return self.fold(result)
+        return result
+
+    def isTruthy(self,operand:Operand,index:int,truthy:bool)->bool:
+        if isinstance(operand,(If,While,Not,NotDecorator)): return index == 0
+        if isinstance(operand,(And,Or)): return index == 0 or truthy
+        if isinstance(operand,(ArrayFilter,ArrayFirst,ArrayLast)): return index == 1
+        return False
+
+    def optimizeOperator(self,operand:Operator,operands:list,truthy:bool)->Operand:
+        _type = type(operand)
+        if _type in self.negations:
+            child = operands[0]
+            if truthy and type(child) in self.negations: return child.operands[0]
+        elif _type is And:
+            a,b = operands[0],operands[1]
+            if isinstance(a,Constant): return b if a.value else Constant(False)
+            if truthy and isinstance(b,Constant) and b.value: return a
+        elif _type is Or:
+            a,b = operands[0],operands[1]
+            if isinstance(a,Constant): return Constant(True) if a.value else b
+            if truthy and isinstance(b,Constant) and not b.value: return a
+        elif _type.value is Operator.value:
+            operands = self.flatten(operand,operands)
+            if _type in self.associatives: operands = self.reassociate(operand,operands)
+            elif _type is Subtraction: operands = self.subtract(operands)
+            operands = self.removeIdentities(_type,operands)
+            if _type is BitAnd and self.isAnnihilated(operands): return Constant(0)
+            if len(operands) == 1: return operands[0]
+        return self.fold(_type(operand.name,operands))
+
+    def flatten(self,operand:Operator,operands:list)->list:
+        # (a+b)+c is solved as the n-ary a+b+c, and a+(b+c) also when the operator is associative
+        _type = type(operand)
+        result = []
+        for i,p in enumerate(operands):
+            if type(p) is _type and p.name == operand.name and (i == 0 or _type in self.associatives):
+                result.extend(p.operands)
+            else:
+                result.append(p)
+        return result
+
+    def reassociate(self,operand:Operator,operands:list)->list:
+        constants = [p for p in operands if isinstance(p,Constant)]
+        if len(constants) < 2: return operands
+        if all(self.isNumeric(p.value) for p in constants):
+            folded = self.fold(type(operand)(operand.name,constants))
+            if not isinstance(folded,Constant): return operands
+            return [p for p in operands if not isinstance(p,Constant)]+[folded]
+        # strings and lists are not commutative, only the adjacent constants are joined
+        result = []
+        for p in operands:
+            if isinstance(p,Constant) and len(result) > 0 and isinstance(result[-1],Constant):
+                folded = self.fold(type(operand)(operand.name,[result[-1],p]))
+                if isinstance(folded,Constant):
+                    result[-1] = folded
+                    continue
+            result.append(p)
+        return result
+
+    def subtract(self,operands:list)->list:
+        # a-1-2 is a-(1+2)
+        count = 0
+        while count < len(operands)-1 and isinstance(operands[-1-count],Constant) and self.isNumeric(operands[-1-count].value):
+            count+=1
+        if count < 2: return operands
+        folded = self.fold(Addition('+',operands[len(operands)-count:]))
+        if not isinstance(folded,Constant): return operands
+        return operands[:len(operands)-count]+[folded]
+
+    def removeIdentities(self,_type,operands:list)->list:
+        if _type not in self.identities: return operands
+        identity = self.identities[_type]
+        start = 0 if _type in self.commutatives else 1
+        result = operands[:start]
+        for p in operands[start:]:
+            # x+0.0 is a float
+            if isinstance(p,Constant) and type(p.value) is int and p.value == identity: continue
+            result.append(p)
+        if len(result) == 0: return operands[:1]
+        # 'a'+0 raises and True*1 is 1, the identity is only removed from numbers, and 1.5|0 raises, from ints for the bitwise operators
+        integer = _type in self.bitwises
+        if len(result) < len(operands) and not all(self.isNumber(p,integer) for p in result): return operands
+        return result
+
+    def isAnnihilated(self,operands:list)->bool:
+        # x & 0 is 0 when x is an int and solving it has no side effects
+        hasZero = any(isinstance(p,Constant) and type(p.value) is int and p.value == 0 for p in operands)
+        return hasZero and all(self.isNumber(p,True) and self.mgr.isPure(p) for p in operands)
+
+    def isNumber(self,operand:Operand,integer:bool=False)->bool:
+        """returns true if the operand is solved as an int or float, or only an int when integer"""
+        if isinstance(operand,Constant): return type(operand.value) is int or (not integer and type(operand.value) is float)
+        if isinstance(operand,Variable): return self.numeric and not integer
+        if type(operand) in self.integers or (not integer and type(operand) in (Division,Exponentiation)):
+            return all(self.isNumber(p,integer) for p in operand.operands)
+        return False
+
+    def isNumeric(self,value)->bool:
+        return type(value) in (int,float,bool)
+
+    def fold(self,operand:Operand)->Operand:
+        if len(operand.operands) == 0 or not all(isinstance(p,Constant) for p in operand.operands): return operand
+        try:
+            value = self.compiler.compile(operand)(Context({}))
+        except Exception:
+            # the error is raised when the expression is evaluated
+            return operand
+        # a list or dict would be shared by all the evaluations, which could change it, 
+        # and the constants are limited to the values that the binary format writes
+        if type(value) not in (type(None),bool,int,float,str): return operand
+        return Constant(value)
+
+class CommonEliminator():
+    """
+    replaces the repeated side effect free subexpressions of a list of statements by Shared operands.
+    The statements are solved in order, so an occurrence is only shared with the previous ones 
+    while no statement assigns the variables that it reads, nor changes a value in place 
+    (push, pop, a dotted call, an impure function, ...) because the value may be reached from any variable.
+    Subexpressions inside while loops and lambda bodies are not shared because their variables change on each iteration
+    """
+    excluded = (Constant,Variable,Array,Object,KeyValue,ArrayMap,ArrayFilter)
+    lambdas = (ArrayForeach,ArrayMap,ArrayFirst,ArrayLast,ArrayFilter)
+
+    def __init__(self,mgr,subexpressions:bool=True,variables:bool=False):
+        """subexpressions shares the repeated operations and variables shares the reads of the same variable"""
+        self.mgr = mgr
+        self.subexpressions = subexpressions
+        self.variables = variables
+
+    def eliminate(self,statements:list)->list:
+        counts = {}
+        self.visit(statements,counts)
+        slots = {}
+        return self.visit(statements,counts,slots)
+
+    def visit(self,statements:list,counts:dict,slots:dict=None)->list:
+        # without slots counts the occurrences, with slots replaces the ones that occur more than once
+        versions = {}
+        # the statements that change values in place start a new epoch, the occurrences of different epochs are not shared
+        epoch = 0
+        result = []
+        for statement in statements:
+            writes = self.getWrites(statement,set())
+            mutates = self.mutates(statement)
+            result.append(self.visitOperand(statement,versions,writes,counts,slots,None if mutates else epoch))
+            for p in writes:
+                versions[p] = versions.get(p,0)+1
+            if mutates: epoch+=1
+        return result
+
+    def visitOperand(self,operand:Operand,versions:dict,writes:set,counts:dict,slots:dict,epoch:int)->Operand:
+        if operand is None: return None
+        key = None
+        if epoch is not None and self.isCandidate(operand):
+            reads = self.getReads(operand,set())
+            if reads.isdisjoint(writes):
+                key = (self.getKey(operand),tuple(sorted((p,versions.get(p,0)) for p in reads)),epoch)
+                if slots is None: counts[key] = counts.get(key,0)+1
+        if isinstance(operand,While):
+            children = operand.operands
+        elif isinstance(operand,self.lambdas):
+            children = [self.visitOperand(operand.operands[0],versions,writes,counts,slots,epoch)]+operand.operands[1:]
+        else:
+            children = [self.visitOperand(p,versions,writes,counts,slots,epoch) for p in operand.operands]
+        if slots is None: return operand
+        result = type(operand)(operand.name,children)
+        if key is not None and counts[key] > 1:
+            if key not in slots: slots[key] = self.mgr.newSlot()
+            return Shared(slots[key],[result])
+        return result
+
+    def isCandidate(self,operand:Operand)->bool:
+        if isinstance(operand,Variable): return self.variables
+        if not self.subexpressions or isinstance(operand,self.excluded): return False
+        return self.mgr.isPure(operand)
+
+    def getKey(self,operand:Operand):
+        if operand is None: return None
+        if isinstance(operand,Constant):
+            value = operand.value
+            try:
+                hash(value)
+            except TypeError:
+                value = id(value)
+            return (Constant,type(operand.value),value)
+        return (type(operand),operand.name,tuple(self.getKey(p) for p in operand.operands))
+
+    def getReads(self,operand:Operand,reads:set)->set:
+        if isinstance(operand,Variable): reads.add(operand.name.split('.')[0])
+        for p in operand.operands:
+            if p is not None: self.getReads(p,reads)
+        return reads
+
+    def getWrites(self,operand:Operand,writes:set)->set:
+        if operand is None: return writes
+        if isinstance(operand,Operator) and self.mgr.category(operand.name) == 'assignment':
+            target = operand.operands[0]
+            if isinstance(target,Variable): writes.add(target.name.split('.')[0])
+        for p in operand.operands:
+            self.getWrites(p,writes)
+        return writes
+
+    def mutates(self,operand:Operand)->bool:
+        """indicates if the operand can change a value in place"""
+        if operand is None: return False
+        if isinstance(operand,(ArrayPush,ArrayPop,ArrayRemove,ArrayReverse,ArraySort,ArrayLast)): return True
+        if isinstance(operand,Function) and ('.' in operand.name or not self.mgr.isPureFunction(operand.name)): return True
+        if isinstance(operand,Operator) and self.mgr.category(operand.name) == 'assignment':
+            target = operand.operands[0]
+            if not isinstance(target,Variable) or '.' in target.name: return True
+        return any(self.mutates(p) for p in operand.operands)
+
+class ExpressionSet():
+    """
+    evaluates many operands against the same context.
+    The operands are solved in order, each distinct variable is read once per evaluation 
+    and with merge the common subexpressions of all the operands are solved once
+    """
+    def __init__(self,mgr,operands,merge:bool=False):
+        self.keys = list(operands.keys()) if isinstance(operands,dict) else None
+        items = list(operands.values()) if isinstance(operands,dict) else list(operands)
+        items = [mgr.parse(p) if isinstance(p,str) else p for p in items]
+        self.operands = CommonEliminator(mgr,subexpressions=merge,variables=True).eliminate(items)
+        self.functions = [mgr.newCompiled(p) for p in self.operands]
+
+    def eval(self,context:dict={}):
+        """returns a dict when the set was created from a dict, otherwise a list"""
+        _context = Context(context)
+        results = [p(_context) for p in self.functions]
+        if self.keys is None: return results
+        return dict(zip(self.keys,results))
+
+    def __len__(self):
+        return len(self.functions)
+
+class ReactiveGraph():
+    """
+    expressions by key over a shared state, solved in the order of their dependencies: an expression depends on the ones
+    that assign the variables it reads. update solves again only the expressions that depend on the variables changed,
+    the results of the rest are kept. The changes made in place (push, pop, remove) are not tracked
+    """
+    lambdas = (ArrayForeach,ArrayMap,ArrayFirst,ArrayLast,ArrayFilter,ArrayReverse,ArraySort)
+
+    def __init__(self,mgr,expressions:dict,state:dict=None):
+        self.mgr = mgr
+        self.state = state if state is not None else {}
+        self.keys = list(expressions.keys())
+        operands = [mgr.parse(p) if isinstance(p,str) else p for p in expressions.values()]
+        self.functions = [mgr.newCompiled(p) for p in operands]
+        self.readers = {}
+        self.writes = []
+        for i,operand in enumerate(operands):
+            reads,writes = set(),set()
+            self.getDependencies(operand,[],reads,writes)
+            for name in reads:
+                self.readers.setdefault(name,[]).append(i)
+            self.writes.append(writes)
+        self.order = self.sort()
+        self.rank = {p:i for i,p in enumerate(self.order)}
+        self.results = {}
+        self.solve(self.order)
+
+    def getDependencies(self,operand:Operand,scopes:list,reads:set,writes:set):
+        """root names of the variables read and assigned by the operand, the elements of the lambdas are excluded"""
+        if operand is None: return
+        if isinstance(operand,Variable):
+            if operand.names[0] not in scopes: reads.add(operand.names[0])
+            return
+        if isinstance(operand,Operator) and self.mgr.category(operand.name) == 'assignment' and isinstance(operand.operands[0],Variable):
+            name = operand.operands[0].names[0]
+            if name not in scopes:
+                writes.add(name)
+                # the assignment operators (+=, -=, ...) read the variable too
+                if type(operand) is not Assigment: reads.add(name)
+            for p in operand.operands[1:]:
+                self.getDependencies(p,scopes,reads,writes)
+            return
+        if isinstance(operand,self.lambdas) and len(operand.operands) > 1:
+            self.getDependencies(operand.operands[0],scopes,reads,writes)
+            for p in operand.operands[1:]:
+                self.getDependencies(p,scopes+[operand.name],reads,writes)
+            return
+        for p in operand.operands:
+            self.getDependencies(p,scopes,reads,writes)
+
+    def sort(self)->list:
+        """indexes of the expressions in topological order, the ones without dependencies between them keep their order"""
+        count = len(self.functions)
+        dependents = [set() for _ in range(count)]
+        pending = [0] * count
+        for i,writes in enumerate(self.writes):
+            for name in writes:
+                for j in self.readers.get(name,[]):
+                    if j != i and j not in dependents[i]:
+                        dependents[i].add(j)
+                        pending[j] += 1
+        ready = [i for i in range(count) if pending[i] == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            i = heapq.heappop(ready)
+            order.append(i)
+            for j in dependents[i]:
+                pending[j] -= 1
+                if pending[j] == 0: heapq.heappush(ready,j)
+        if len(order) < count:
+            cycle = [str(self.keys[i]) for i in range(count) if pending[i] > 0]
+            raise ExpressionError('cyclic dependencies between: '+', '.join(cycle))
+        return order
+
+    def solve(self,indexes:list)->dict:
+        context = Context(self.state)
+        solved = {}
+        for i in indexes:
+            solved[self.keys[i]] = self.results[self.keys[i]] = self.functions[i](context)
+        return solved
+
+    def affected(self,names)->list:
+        """indexes of the expressions that depend on the variables, in the order they are solved"""
+        affected = set()
+        pending = list(names)
+        while pending:
+            for i in self.readers.get(pending.pop(),[]):
+                if i in affected: continue
+                affected.add(i)
+                pending.extend(self.writes[i])
+        return sorted(affected,key=self.rank.__getitem__)
+
+    def update(self,values:dict)->dict:
+        """assigns the values to the state and returns the results of the expressions solved again"""
+        self.state.update(values)
+        return self.solve(self.affected(values.keys()))
+
+    def __getitem__(self,key):
+        return self.results[key]
+
+    def __len__(self):
+        return len(self.functions)
+
+class RuleIndex():
+    """
+    matches many boolean rules against a context. The conditions joined by && that compare a variable with a constant
+    and precede any other condition of the rule, so eval would solve them first, are indexed: the equalities in a hash table by variable and the ranges in sorted lists of constants by variable and operator,
+    the same condition of several rules is solved once. Only the rules whose indexed conditions are all true solve the rest
+    of their conditions, the rules without indexed conditions, with assignments or with values that can not be
+    compared by the index are solved entirely
+    """
+    # operator of the condition when the constant is at the left: 5 < a is a > 5
+    flipped = {Equal:Equal,GreaterThan:LessThan,LessThan:GreaterThan,GreaterThanOrEqual:LessThanOrEqual,LessThanOrEqual:GreaterThanOrEqual}
+
+    def __init__(self,mgr,rules:dict):
+        self.mgr = mgr
+        self.keys = list(rules.keys())
+        compiler = Compiler(mgr)
+        self.getters = {}
+        self.equals = {}
+        # (variable,operator): sorted constants and the rules of each constant
+        self.ranges = {}
+        # rules that read each variable indexed, solved entirely when its value can not be compared
+        self.readers = {}
+        self.needed = []
+        self.rest = []
+        self.functions = []
+        self.always = []
+        for i,rule in enumerate(rules.values()):
+            operand = mgr.parse(rule) if isinstance(rule,str) else rule
+            self.functions.append(compiler.compile(operand))
+            conditions = self.getConditions(operand) if not self.hasAssignment(operand) else [operand]
+            indexed = set()
+            rest = []
+            for condition in conditions:
+                # after a condition that is not indexed, which may raise or call functions, the rest are solved in order
+                predicate = self.getPredicate(condition) if not rest else None
+                if predicate is None: rest.append(compiler.compile(condition))
+                else: indexed.add(predicate)
+            self.needed.append(len(indexed))
+            self.rest.append(rest)
+            if not indexed: self.always.append(i)
+            for names,_type,value in indexed:
+                if names not in self.getters: self.getters[names] = compiler.compileGetter(names)
+                self.readers.setdefault(names,set()).add(i)
+                if _type is Equal: self.equals.setdefault(names,{}).setdefault(value,[]).append(i)
+                else: self.ranges.setdefault((names,_type),{}).setdefault(value,[]).append(i)
+        for key,items in self.ranges.items():
+            constants = sorted(items)
+            self.ranges[key] = (constants,[items[p] for p in constants])
+
+    def getConditions(self,operand:Operand)->list:
+        """operands joined by && in the order they are solved"""
+        conditions = []
+        pending = [operand]
+        while pending:
+            p = pending.pop()
+            if type(p) is And: pending.extend(reversed(p.operands))
+            else: conditions.append(p)
+        return conditions
+
+    def hasAssignment(self,operand:Operand)->bool:
+        if operand is None: return False
+        if isinstance(operand,Operator) and self.mgr.category(operand.name) == 'assignment': return True
+        return any(self.hasAssignment(p) for p in operand.operands)
+
+    def getPredicate(self,condition:Operand)->tuple:
+        """(names of the variable,operator,constant) of a comparison that can be indexed, otherwise None"""
+        _type = type(condition)
+        if _type not in RuleIndex.flipped: return None
+        a,b = condition.operands
+        if isinstance(a,Constant) and isinstance(b,Variable):
+            a,b,_type = b,a,RuleIndex.flipped[_type]
+        if not isinstance(a,Variable) or not isinstance(b,Constant): return None
+        value = b.value
+        if _type is Equal:
+            try:
+                hash(value)
+            except TypeError:
+                return None
+            return (a.names,_type,value) if value == value else None
+        # the ranges only index numbers, sorting them does not depend on their type
+        if type(value) not in (int,float) or value != value: return None
+        return (a.names,_type,value)
+
+    def match(self,context:dict={})->list:
+        """keys of the rules that are true for the context, in the order they were added"""
+        _context = Context(context)
+        counts = {}
+        unknown = set()
+        values = {}
+        for names,getter in self.getters.items():
+            try:
+                values[names] = getter(_context)
+            except Exception:
+                # the path can not be read, as x.y with a number x, the rules that read it are solved entirely
+                unknown.update(self.readers[names])
+        for names,table in self.equals.items():
+            if names not in values: continue
+            try:
+                rules = table.get(values[names])
+            except TypeError:
+                unknown.update(self.readers[names])
+                continue
+            if rules is not None:
+                for i in rules: counts[i] = counts.get(i,0) + 1
+        for (names,_type),(constants,rules) in self.ranges.items():
+            if names not in values: continue
+            value = values[names]
+            if type(value) not in (int,float,bool) or value != value:
+                unknown.update(self.readers[names])
+                continue
+            if _type is GreaterThan: selected = rules[:bisect.bisect_left(constants,value)]
+            elif _type is GreaterThanOrEqual: selected = rules[:bisect.bisect_right(constants,value)]
+            elif _type is LessThan: selected = rules[bisect.bisect_right(constants,value):]
+            else: selected = rules[bisect.bisect_left(constants,value):]
+            for items in selected:
+                for i in items: counts[i] = counts.get(i,0) + 1
+        needed = self.needed
+        candidates = [i for i,count in counts.items() if count == needed[i] and i not in unknown]
+        candidates.extend(self.always)
+        candidates.sort()
+        matches = []
+        position = 0
+        unknown = sorted(unknown)
+        # the candidates solve the conditions not indexed, the unknown rules are solved entirely, both in order
+        for i in candidates:
+            while position < len(unknown) and unknown[position] < i:
+                if self.functions[unknown[position]](_context): matches.append(self.keys[unknown[position]])
+                position += 1
+            if all(p(_context) for p in self.rest[i]): matches.append(self.keys[i])
+        for i in unknown[position:]:
+            if self.functions[i](_context): matches.append(self.keys[i])
+        return matches
+
+    def __len__(self):
+        return len(self.keys)
+
+class BinaryFormat():
+    """
+    binary form of the operands:
+    header (magic and version), table of strings, table of types (index of the name in the strings),
+    shape of the content (operand, list or dict) and the operands in preorder.
+    Each node is its type (index + 1, 0 for a missing operand), its name and the number of its children,
+    the integers are varints and the strings indexes of the table
+    """
+    MAGIC = b'PEXP'
+    VERSION = 1
+    OPERAND,LIST,DICT = range(3)
+    NONE,FALSE,TRUE,INT,FLOAT,STRING,ARRAY,OBJECT = range(8)
+
+class BinaryWriter():
+    def __init__(self,mgr):
+        self.mgr = mgr
+        self.strings = {}
+        self.types = {}
+        self.body = bytearray()
+
+    def write(self,operands)->bytes:
+        body = self.body
+        if isinstance(operands,dict):
+            body.append(BinaryFormat.DICT)
+            self.writeInt(len(operands))
+            for key,operand in operands.items():
+                self.writeInt(self.getString(key))
+                self.writeOperand(operand)
+        elif isinstance(operands,(list,tuple)):
+            body.append(BinaryFormat.LIST)
+            self.writeInt(len(operands))
+            for operand in operands:
+                self.writeOperand(operand)
+        else:
+            body.append(BinaryFormat.OPERAND)
+            self.writeOperand(operands)
+        # the names of the types are added to the strings before writing the table
+        types = [self.getString(p.__name__) for p in self.types]
+        header = bytearray(BinaryFormat.MAGIC)
+        header.append(BinaryFormat.VERSION)
+        self.body = header
+        self.writeInt(len(self.strings))
+        for value in self.strings:
+            encoded = value.encode('utf-8')
+            self.writeInt(len(encoded))
+            header.extend(encoded)
+        self.writeInt(len(types))
+        for index in types:
+            self.writeInt(index)
+        return bytes(header + body)
+
+    def writeInt(self,value:int):
+        body = self.body
+        while value > 0x7f:
+            body.append((value & 0x7f) | 0x80)
+            value >>= 7
+        body.append(value)
+
+    def getString(self,value:str)->int:
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+        return index
+
+    def getType(self,source)->int:
+        if self.mgr.getType(source.__name__) is not source:
+            raise ExpressionError('type '+source.__name__+' is not registered')
+        index = self.types.get(source)
+        if index is None:
+            index = self.types[source] = len(self.types)
+        return index
+
+    def writeOperand(self,operand:Operand):
+        # preorder with a list of pending operands, the deep trees do not recurse
+        pending = [operand]
+        while pending:
+            operand = pending.pop()
+            if operand is None:
+                self.writeInt(0)
+                continue
+            self.writeInt(self.getType(type(operand))+1)
+            self.writeValue(operand.name)
+            self.writeInt(len(operand.operands))
+            pending.extend(reversed(operand.operands))
+
+    def writeValue(self,value):
+        body = self.body
+        if value is None: body.append(BinaryFormat.NONE)
+        elif value is False: body.append(BinaryFormat.FALSE)
+        elif value is True: body.append(BinaryFormat.TRUE)
+        elif isinstance(value,str):
+            body.append(BinaryFormat.STRING)
+            self.writeInt(self.getString(value))
+        elif isinstance(value,int):
+            body.append(BinaryFormat.INT)
+            # zigzag, the negative numbers are odd
+            self.writeInt(value << 1 if value >= 0 else ((-value) << 1) - 1)
+        elif isinstance(value,float):
+            body.append(BinaryFormat.FLOAT)
+            body.extend(struct.pack('<d',value))
+        elif isinstance(value,list):
+            body.append(BinaryFormat.ARRAY)
+            self.writeInt(len(value))
+            for p in value: self.writeValue(p)
+        elif isinstance(value,dict):
+            body.append(BinaryFormat.OBJECT)
+            self.writeInt(len(value))
+            for key,p in value.items():
+                self.writeInt(self.getString(key))
+                self.writeValue(p)
+        else:
+            raise ExpressionError('value of type '+type(value).__name__+' can not be serialized')
+
+class BinaryReader():
+    def __init__(self,mgr,data:bytes,offset:int=0):
+        self.mgr = mgr
+        self.data = data
+        self.position = offset
+        self.strings = []
+        self.types = []
+
+    def read(self):
+        # the operands are trees without cycles, the collector is paused while they are created
+        collect = gc.isenabled()
+        gc.disable()
+        try:
+            self.readHeader()
+            shape = self.readByte()
+            if shape == BinaryFormat.OPERAND: return self.readOperand()
+            if shape == BinaryFormat.LIST: return [self.readOperand() for _ in range(self.readInt())]
+            if shape == BinaryFormat.DICT:
+                result = {}
+                for _ in range(self.readInt()):
+                    key = self.strings[self.readInt()]
+                    result[key] = self.readOperand()
+                return result
+        except (IndexError,struct.error):
+            raise ExpressionError('unexpected end of the serialized expression')
+        finally:
+            if collect: gc.enable()
+        raise ExpressionError('shape '+str(shape)+' not supported')
+
+    def readHeader(self):
+        data = self.data
+        start = self.position
+        if bytes(data[start:start+len(BinaryFormat.MAGIC)]) != BinaryFormat.MAGIC:
+            raise ExpressionError('the data is not a serialized expression')
+        self.position += len(BinaryFormat.MAGIC)
+        version = self.readByte()
+        if version != BinaryFormat.VERSION:
+            raise ExpressionError('version '+str(version)+' of the serialized expressions not supported')
+        strings = self.strings
+        for _ in range(self.readInt()):
+            length = self.readInt()
+            strings.append(str(data[self.position:self.position+length],'utf-8'))
+            self.position += length
+        self.types = [self.mgr.getType(strings[self.readInt()]) for _ in range(self.readInt())]
+
+    def readByte(self)->int:
+        if self.position >= len(self.data): raise ExpressionError('unexpected end of the serialized expression')
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def readInt(self)->int:
+        data = self.data
+        position = self.position
+        value = data[position]
+        position += 1
+        if value < 0x80:
+            self.position = position
+            return value
+        value &= 0x7f
+        shift = 7
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80: break
+            shift += 7
+        self.position = position
+        return value
+
+    def readOperand(self)->Operand:
+        # the varints of one byte and the names are read inline, it is the loop that loads the catalogues.
+        # each frame is the type, the name, the children expected and the children created
+        data = self.data
+        types = self.types
+        strings = self.strings
+        STRING,INT = BinaryFormat.STRING,BinaryFormat.INT
+        position = self.position
+        frames = []
+        while True:
+            tag = data[position]
+            if tag > 0x7f:
+                self.position = position
+                tag = self.readInt()
+                position = self.position
+            else: position += 1
+            if tag == 0:
+                operand = None
+            else:
+                source = types[tag-1]
+                kind = data[position]
+                if kind == STRING and data[position+1] < 0x80:
+                    name = strings[data[position+1]]
+                    position += 2
+                elif kind == INT and data[position+1] < 0x80:
+                    value = data[position+1]
+                    name = value >> 1 if not value & 1 else -((value + 1) >> 1)
+                    position += 2
+                else:
+                    self.position = position
+                    name = self.readValue()
+                    position = self.position
+                count = data[position]
+                if count > 0x7f:
+                    self.position = position
+                    count = self.readInt()
+                    position = self.position
+                else: position += 1
+                if count > 0:
+                    frames.append((source,name,count,[]))
+                    continue
+                operand = source(name)
+            while True:
+                if not frames:
+                    self.position = position
+                    return operand
+                source,name,count,children = frames[-1]
+                children.append(operand)
+                if len(children) < count: break
+                frames.pop()
+                operand = source(name,children)
+
+    def readValue(self):
+        kind = self.readByte()
+        if kind == BinaryFormat.STRING: return self.strings[self.readInt()]
+        if kind == BinaryFormat.INT:
+            value = self.readInt()
+            return value >> 1 if not value & 1 else -((value + 1) >> 1)
+        if kind == BinaryFormat.NONE: return None
+        if kind == BinaryFormat.FALSE: return False
+        if kind == BinaryFormat.TRUE: return True
+        if kind == BinaryFormat.FLOAT:
+            value = struct.unpack_from('<d',self.data,self.position)[0]
+            self.position += 8
+            return value
+        if kind == BinaryFormat.ARRAY: return [self.readValue() for _ in range(self.readInt())]
+        if kind == BinaryFormat.OBJECT:
+            result = {}
+            for _ in range(self.readInt()):
+                key = self.strings[self.readInt()]
+                result[key] = self.readValue()
+            return result
+        raise ExpressionError('kind of value '+str(kind)+' not supported')
+
+class CatalogueFormat():
+    """
+    file of a catalogue: header (magic, version, number of expressions), index sorted by key with entries of
+    fixed size (offset and length of the key, offset and length of the expression), the keys in utf-8 and
+    the binary form of each expression.
+    The index is searched in the mapped file, so the startup does not depend on the size of the catalogue
+    """
+    MAGIC = b'PEXC'
+    VERSION = 1
+    header = struct.Struct('<4sB3xQ')
+    entry = struct.Struct('<QIQI')
+
+class CatalogueWriter():
+    def __init__(self,mgr):
+        self.mgr = mgr
+
+    def write(self,operands:dict,filename:str)->int:
+        items = sorted((key.encode('utf-8'),self.mgr.dumps(operand)) for key,operand in operands.items())
+        offset = CatalogueFormat.header.size + CatalogueFormat.entry.size * len(items)
+        keysOffset = offset
+        dataOffset = keysOffset + sum(len(key) for key,_ in items)
+        with open(filename,'wb') as f:
+            f.write(CatalogueFormat.header.pack(CatalogueFormat.MAGIC,CatalogueFormat.VERSION,len(items)))
+            for key,data in items:
+                f.write(CatalogueFormat.entry.pack(keysOffset,len(key),dataOffset,len(data)))
+                keysOffset += len(key)
+                dataOffset += len(data)
+            for key,_ in items:
+                f.write(key)
+            for _,data in items:
+                f.write(data)
+        return len(items)
+
+class Catalogue():
+    """
+    expressions of a catalogue file mapped in memory, the processes that load the same file share its pages.
+    Each expression is read from the file the first time it is used
+    """
+    def __init__(self,mgr,filename:str):
+        self.mgr = mgr
+        self.filename = filename
+        self._operands = {}
+        with open(filename,'rb') as f:
+            self._map = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        if len(self._map) < CatalogueFormat.header.size:
+            self.close()
+            raise ExpressionError('file '+filename+' is not a catalogue')
+        magic,version,self._count = CatalogueFormat.header.unpack_from(self._map,0)
+        if magic != CatalogueFormat.MAGIC:
+            self.close()
+            raise ExpressionError('file '+filename+' is not a catalogue')
+        if version != CatalogueFormat.VERSION:
+            self.close()
+            raise ExpressionError('version '+str(version)+' of the catalogue not supported')
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self,key:str):
+        return key in self._operands or self.find(key) is not None
+
+    def __getitem__(self,key:str)->Operand:
+        operand = self._operands.get(key)
+        if operand is not None: return operand
+        entry = self.find(key)
+        if entry is None: raise KeyError(key)
+        _,_,offset,length = entry
+        operand = self._operands[key] = BinaryReader(self.mgr,self._map[offset:offset+length]).read()
+        return operand
+
+    def get(self,key:str,default=None)->Operand:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        for index in range(self._count):
+            yield self.getKey(self.getEntry(index)).decode('utf-8')
+
+    def items(self):
+        for key in self.keys():
+            yield key,self[key]
+
+    @property
+    def loaded(self)->int:
+        """number of expressions read from the file"""
+        return len(self._operands)
+
+    def getEntry(self,index:int)->tuple:
+        return CatalogueFormat.entry.unpack_from(self._map,CatalogueFormat.header.size + CatalogueFormat.entry.size * index)
+
+    def getKey(self,entry:tuple)->bytes:
+        return self._map[entry[0]:entry[0]+entry[1]]
+
+    def find(self,key:str)->tuple:
+        """binary search of the key in the index of the file"""
+        target = key.encode('utf-8')
+        low,high = 0,self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self.getEntry(middle)
+            current = self.getKey(entry)
+            if current == target: return entry
+            if current < target: low = middle + 1
+            else: high = middle
+        return None
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+    def __exit__(self,*args):
+        self.close()
+
+class Worker():
+    """state of a process of Exp.evalParallel, the operand is loaded once by the initializer of the pool"""
+    operand = None
+    error = None
+
+    @staticmethod
+    def init(state:dict):
+        exp = Exp()
+        try:
+            for key,category,source,priority in state['operators']:
+                if key not in exp._operators or exp._operators[key]['imp'] is not source:
+                    exp.addOperator(key,category,source,priority)
+            for key,source in state['enums'].items():
+                exp.addEnum(key,source)
+            for name,source,types,pure,cacheSize in state['functions']:
+                exp.addFunction(name,source,types,pure,cacheSize)
+            exp.engine = state['engine']
+            Worker.operand = exp.bind(exp.loads(state['data']))
+        except ExpressionError as error:
+            # an exception in the initializer breaks the pool, it is raised by the chunks instead
+            Worker.error = error
+
+    @staticmethod
+    def solve(contexts:list)->list:
+        if Worker.error is not None: raise Worker.error
+        return list(Exp().evalStream(Worker.operand,contexts))
@@ -0,0 +1,325 @@
+import sys
+import json
+import time
+import random
+import timeit
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime
+from py_expression.core import Exp,Context,Compiler,StackCompiler
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+exp = Exp()
+
+class SplitCompiler(Compiler):
+    """compiles the variables as they were read before the paths were resolved, splitting the name on each access"""
+    def compileVariable(self,operand):
+        name = operand.name
+        return lambda context: context.get(name)
+
+def dottedRead(number:int=200000):
+    """compares the throughput reading a dotted variable, from the root context and from the scope of a lambda"""
+    data = {'c':{'customer':{'address':{'zip':'1424'}}}
+           ,'items':[{'customer':{'address':{'zip':str(i)}}} for i in range(1000)]}
+    results = {}
+    for expression,count in [('c.customer.address.zip',number),('items.map(p: p.customer.address.zip)',number//1000)]:
+        operand = exp.parse(expression)
+        for name,compiler in [('split',SplitCompiler(exp)),('resolved',Compiler(exp))]:
+            function = compiler.compile(operand)
+            context = Context(data)
+            seconds = timeit.timeit(lambda: function(context),number=count)
+            results[expression+' '+name] = count/seconds
+    return results
+
+def catalogue(count:int)->list:
+    """rules with the shapes of a catalogue: comparisons of dotted variables, arithmetic, functions, lambdas and blocks"""
+    generator = random.Random(count)
+    shapes = ['order.total > {0} && customer.type == "gold"'
+             ,'(price * qty - discount) * {0} / 100'
+             ,'nvl(customer.address.zip,"{0}") != "" || order.express'
+             ,'items.filter(p: p.price > {0}).map(p: p.price * p.qty)'
+             ,'floor(sqrt(a * a + b * b)) % {0} == 0'
+             ,'total = 0; i = 0; while(i < {0}){{ total += i; i += 1; }}']
+    return [shapes[i % len(shapes)].format(generator.randint(1,1000)) for i in range(count)]
+
+def nodes(operand)->int:
+    return 1 + sum(nodes(p) for p in operand.operands if p is not None)
+
+def memoryReport(count:int=5000)->dict:
+    """bytes allocated per node of a parsed catalogue, in total and by the node objects alone"""
+    expressions = catalogue(count)
+    cacheSize = exp.cacheSize
+    exp.cacheSize = 0
+    try:
+        tracemalloc.start()
+        start,_ = tracemalloc.get_traced_memory()
+        operands = [exp.parse(p) for p in expressions]
+        end,_ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        exp.cacheSize = cacheSize
+    total = sum(nodes(p) for p in operands)
+    objects = []
+    def collect(operand):
+        objects.append(operand)
+        for p in operand.operands:
+            if p is not None: collect(p)
+    for operand in operands: collect(operand)
+    shallow = sum(sys.getsizeof(p) + (sys.getsizeof(p.__dict__) if hasattr(p,'__dict__') else 0) for p in objects)
+    return {'expressions':count,'nodes':total,'bytesPerNode':(end-start)/total,'objectBytesPerNode':shallow/total}
+
+class Case():
+    """a function measured by the suite, setup builds what the function needs outside of the measure"""
+    def __init__(self,group:str,name:str,setup):
+        self.group = group
+        self.name = name
+        self.setup = setup
+
+    @property
+    def key(self):
+        return self.group+'.'+self.name
+
+class Runner():
+    """
+    measures each case in rounds of calls, the number of calls of a round is calibrated so that it lasts at least
+    the resolution, the latency of a round divided by its calls is a sample of the percentiles.
+    the peak of memory is measured apart because tracemalloc slows the calls
+    """
+    def __init__(self,duration:float=0.5,resolution:float=0.002,minRounds:int=5):
+        self.duration = duration
+        self.resolution = resolution
+        self.minRounds = minRounds
+
+    def calibrate(self,function)->int:
+        calls = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(calls): function()
+            if time.perf_counter() - start >= self.resolution or calls >= 1 << 20: return calls
+            calls *= 2
+
+    def measure(self,function)->dict:
+        function()
+        calls = self.calibrate(function)
+        samples = []
+        total = 0.0
+        while total < self.duration or len(samples) < self.minRounds:
+            start = time.perf_counter()
+            for _ in range(calls): function()
+            elapsed = time.perf_counter() - start
+            total += elapsed
+            samples.append(elapsed/calls)
+        samples.sort()
+        return {'opsPerSec':len(samples)*calls/total
+               ,'calls':len(samples)*calls
+               ,'mean':total/(len(samples)*calls)
+               ,'p50':percentile(samples,50)
+               ,'p90':percentile(samples,90)
+               ,'p99':percentile(samples,99)
+               ,'min':samples[0]
+               ,'max':samples[-1]}
+
+    def peakMemory(self,function)->int:
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            current,_ = tracemalloc.get_traced_memory()
+            function()
+            _,peak = tracemalloc.get_traced_memory()
+            return peak - current
+        finally:
+            tracemalloc.stop()
+
+    def run(self,case:Case)->dict:
+        function = case.setup()
+        result = self.measure(function)
+        result['peakMemory'] = self.peakMemory(function)
+        return result
+
+def percentile(samples:list,percent:float)->float:
+    """percentile of the ordered samples by the nearest rank"""
+    index = max(0,min(len(samples)-1,int(round(percent/100*len(samples)+0.5))-1))
+    return samples[index]
+
+def longExpression(terms:int)->str:
+    generator = random.Random(terms)
+    return ' + '.join('{0}*{1}'.format(generator.choice('abcde'),generator.randint(1,100)) for _ in range(terms))
+
+def nestedExpression(depth:int)->str:
+    return '('*depth+'a'+''.join(' + {0})'.format(i) for i in range(depth))
+
+def items(count:int)->list:
+    generator = random.Random(count)
+    return [{'id':i,'price':generator.randint(1,1000),'qty':generator.randint(1,20),'customer':{'address':{'zip':str(1000+i%100)}}} for i in range(count)]
+
+def parseCase(expression:str):
+    # parse is memoized by the cache, it is disabled while the case is measured
+    def setup():
+        exp.cacheSize = 0
+        return lambda: exp.parse(expression)
+    return setup
+
+def catalogueCase(count:int):
+    def setup():
+        exp.cacheSize = 0
+        expressions = catalogue(count)
+        return lambda: [exp.parse(p) for p in expressions]
+    return setup
+
+def evalCase(expression:str,context:dict):
+    def setup():
+        operand = exp.parse(expression)
+        return lambda: exp.eval(operand,context)
+    return setup
+
+def stackCase(expression:str,context:dict):
+    # the program is built apart so the case does not change the engine of the manager
+    def setup():
+        program = StackCompiler(exp).compile(exp.parse(expression))
+        return lambda: program(Context(context))
+    return setup
+
+def blockCase(expression:str,variables:dict):
+    # the block assigns its variables, each call starts from a copy of the initial values
+    def setup():
+        operand = exp.parse(expression)
+        return lambda: exp.eval(operand,dict(variables))
+    return setup
+
+def roundTripCase(expression:str):
+    def setup():
+        operand = exp.parse(expression)
+        return lambda: exp.deserialize(exp.serialize(operand))
+    return setup
+
+def binaryCase(expression:str):
+    def setup():
+        operand = exp.parse(expression)
+        return lambda: exp.loads(exp.dumps(operand))
+    return setup
+
+def loadCase(count:int):
+    def setup():
+        cacheSize = exp.cacheSize
+        exp.cacheSize = 0
+        try:
+            data = exp.dumps([exp.parse(p) for p in catalogue(count)])
+        finally:
+            exp.cacheSize = cacheSize
+        return lambda: exp.loads(data)
+    return setup
+
+def batchCase(expression:str,rows:int):
+    def setup():
+        generator = random.Random(rows)
+        columns = {'a':[generator.random() for _ in range(rows)],'b':[generator.random() for _ in range(rows)]}
+        if np is not None: columns = {k:np.array(v) for k,v in columns.items()}
+        operand = exp.parse(expression)
+        return lambda: exp.evalBatch(operand,columns)
+    return setup
+
+def cases()->list:
+    values = {'a':1,'b':2,'c':3,'d':4,'e':5}
+    collection = {'items':items(10000),'c':{'customer':{'address':{'zip':'1424'}}}}
+    loop = """
+        i = 0;
+        total = 0;
+        while(i < 1000){
+            total = total + i * 2;
+            i = i + 1;
+        }
+        """
+    return [
+        Case('parse','short',parseCase('a + b * 2')),
+        Case('parse','long',parseCase(longExpression(200))),
+        Case('parse','nested',parseCase(nestedExpression(100))),
+        Case('parse','block',parseCase(loop)),
+        Case('eval','arithmetic',evalCase('(a + b * c - d) / e ** 2 % 7',values)),
+        Case('eval','dotted',evalCase('c.customer.address.zip',collection)),
+        Case('eval','functions',evalCase('trunc(sqrt(a*a + b*b)) + floor(c/d) + nvl(e,0)',values)),
+        Case('eval','methods',evalCase('name.strip().upper() + code.lower() + date.strftime("%Y")',{'name':' ana ','code':'AR','date':datetime(2020,1,1)})),
+        Case('eval','map',evalCase('items.map(p: p.price * p.qty)',collection)),
+        Case('eval','filter',evalCase('items.filter(p: p.price > 500 && p.qty < 10)',collection)),
+        Case('eval','filterMap',evalCase('items.filter(p: p.customer.address.zip == "1042").map(p: p.id)',collection)),
+        Case('eval','filterMapFirst',evalCase('items.filter(p: p.price > 500).map(p: p.price * p.qty).first(q: q > 5000)',collection)),
+        Case('eval','while',blockCase(loop,{})),
+        Case('stack','arithmetic',stackCase('(a + b * c - d) / e ** 2 % 7',values)),
+        Case('stack','long',stackCase(longExpression(2000),values)),
+        Case('stack','while',stackCase(loop,{})),
+        Case('serialize','short',roundTripCase('a + b * 2')),
+        Case('serialize','long',roundTripCase(longExpression(200))),
+        Case('serialize','block',roundTripCase(loop)),
+        Case('binary','short',binaryCase('a + b * 2')),
+        Case('binary','long',binaryCase(longExpression(200))),
+        Case('binary','block',binaryCase(loop)),
+        Case('binary','catalogue',loadCase(1000)),
+        Case('parse','catalogue',catalogueCase(1000)),
+        Case('batch','arithmetic',batchCase('a * 2 + b / 3 - a * b',100000))
+    ]
+
+def environment()->dict:
+    return {'date':datetime.now().isoformat(timespec='seconds')
+           ,'python':platform.python_version()
+           ,'implementation':platform.python_implementation()
+           ,'platform':platform.platform()
+           ,'numpy':np.__version__ if np is not None else None}
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m py_expression_benchmark',description='benchmark of parse, eval and batch throughput')
+    parser.add_argument('-k','--filter',default='',help='only the cases whose group.name contains the text')
+    parser.add_argument('-d','--duration',type=float,default=0.5,help='seconds measured by case')
+    parser.add_argument('-o','--output',help='writes the results as json to the file, - for the standard output')
+    parser.add_argument('-c','--compare',help='json file of a previous run, reports the change of ops/s of each case')
+    parser.add_argument('--memory',action='store_true',help='reports the bytes per node of a parsed catalogue')
+    parser.add_argument('--list',action='store_true',help='lists the cases')
+    parser.add_argument('--dotted',action='store_true',help='compares the reading of dotted variables through Context.get and the resolved path')
+    options = parser.parse_args(args)
+    if options.dotted:
+        for name,opsPerSecond in dottedRead().items():
+            print('{0:<48}{1:>14,.0f} ops/s'.format(name,opsPerSecond))
+        return
+    if options.memory:
+        report = memoryReport()
+        print('{0:,} expressions, {1:,} nodes'.format(report['expressions'],report['nodes']))
+        print('{0:.1f} bytes per node allocated by parse, {1:.1f} bytes per node object'.format(report['bytesPerNode'],report['objectBytesPerNode']))
+        return
+    selected = [p for p in cases() if options.filter in p.key]
+    if options.list:
+        for case in selected: print(case.key)
+        return
+    runner = Runner(duration=options.duration)
+    cacheSize = exp.cacheSize
+    results = {}
+    report = sys.stderr if options.output == '-' else sys.stdout
+    print('{0:<22}{1:>14}{2:>12}{3:>12}{4:>12}{5:>14}'.format('case','ops/s','p50 us','p90 us','p99 us','peak KiB'),file=report)
+    try:
+        for case in selected:
+            result = runner.run(case)
+            exp.cacheSize = cacheSize
+            results[case.key] = result
+            print('{0:<22}{1:>14,.1f}{2:>12.2f}{3:>12.2f}{4:>12.2f}{5:>14,.1f}'.format(case.key,result['opsPerSec'],result['p50']*1e6
+                  ,result['p90']*1e6,result['p99']*1e6,result['peakMemory']/1024),file=report)
+    finally:
+        exp.cacheSize = cacheSize
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+        print('{0:<22}{1:>14}{2:>14}{3:>10}'.format('case','before ops/s','after ops/s','change'),file=report)
+        for key,result in results.items():
+            if key not in baseline: continue
+            before = baseline[key]['opsPerSec']
+            print('{0:<22}{1:>14,.1f}{2:>14,.1f}{3:>+9.1f}%'.format(key,before,result['opsPerSec'],(result['opsPerSec']/before-1)*100),file=report)
+    if options.output:
+        document = json.dumps({'environment':environment(),'results':results},indent=2)
+        if options.output == '-':
+            print(document)
+        else:
+            with open(options.output,'w') as f:
+                f.write(document)
+
+if __name__ == '__main__':
+    main()
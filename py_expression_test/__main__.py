@@ -1,6 +1,18 @@
+import os
 import unittest
-from py_expression.core import Exp,Token
+import tempfile
+import itertools
+import math
+import asyncio
+import threading
+from py_expression.core import Exp,Token,ExpressionError,Budget,BudgetError
+from py_expression.core import Variable,Constant,NegativeDecorator,ArraySort,ArrayReverse,ArrayPush,ArrayPop,ArrayRemove
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 exp = Exp()
 
@@ -146,8 +158,8 @@ class TestExpression(unittest.TestCase):
         self.assertEqual(exp.solve('a.filter(p: p>1 && p<5).map(p: p*2)',context),[4,6,8])
         context = {"a":[1,2,3,4,5],"b":0}
         self.assertEqual(exp.solve('a.filter(p: p>1 && p<5).reverse()',context),[4,3,2])
-        # context = {"a":[1,2,3,4,5],"b":0}
-        # self.assertEqual(exp.solve('a.filter(p: p>1 && p<5).map(p: p*2).reverse()',context),[8,6,4])
+        context = {"a":[1,2,3,4,5],"b":0}
+        self.assertEqual(exp.solve('a.filter(p: p>1 && p<5).map(p: p*2).reverse()',context),[8,6,4])
 
     def test_serialize(self): 
         operand =exp.parse(('i=0;'
@@ -162,6 +174,505 @@ class TestExpression(unittest.TestCase):
         exp.eval(operand2,context)
         self.assertEqual(context['output'],12) 
 
+    def test_compile(self):
+        expressions = ['a+b','a-b','a*b','a/b','a**b','a//b','a%b','a&b','a|b','a^b','~a','a<<b','a>>b',
+                       'a==b','a!=b','a>b','a<b','a>=b','a<=b','a>b && b>1','a<b || b<1','!(a>b)','-a*b',
+                       'nvl(z,b)','c.b + c.a','s.upper()','s.count("a")','[a,b,c.a]','{"x":a,"y":[b]}','l[1]',
+                       'l.filter(p: p>1 && p<5).map(p: p*b)','l.first(p: p%2==0)','l.last(p: p%2==0)']
+        for expression in expressions:
+            context1 = {"a":7,"b":2,"c":{"a":4,"b":5},"s":"aaa","l":[1,2,3,4,5]}
+            context2 = {"a":7,"b":2,"c":{"a":4,"b":5},"s":"aaa","l":[1,2,3,4,5]}
+            self.assertEqual(exp.parse(expression).compile()(context1),exp.solve(expression,context2),expression)
+
+        assignments = ['x=a','x=1;x+=b','x=1;x-=b','x=2;x*=b','x=2;x/=b','x=2;x**=b','x=9;x//=b','x=9;x%=b',
+                       'x=3;x&=b','x=3;x|=b','x=3;x^=b','x=3;x<<=b','x=9;x>>=b','c.a=b','x=0;l.foreach(p: x=x+p)',
+                       'i=0;while(i<=6){x=i*2;i=i+1;}','if(a>b){x=1}else{x=2}']
+        for expression in assignments:
+            context1 = {"a":7,"b":2,"c":{"a":4,"b":5},"l":[1,2,3,4,5]}
+            context2 = {"a":7,"b":2,"c":{"a":4,"b":5},"l":[1,2,3,4,5]}
+            exp.parse(expression).compile()(context1)
+            exp.solve(expression,context2)
+            self.assertEqual(context1,context2,expression)
+
+        function = exp.compile(exp.parse('s.upper() + s'))
+        self.assertEqual(function({"s":"a"}),'Aa')
+        self.assertEqual(function({"s":"b"}),'Bb')
+
+    def test_reentrant(self):
+        contexts = [{"a":str(i),"b":list(range(i)),"x":i % 7} for i in range(200)]
+        expected = [c['a'].upper() for c in contexts]
+        operand = exp.parse('a.upper()')
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(operand.eval,contexts))
+        self.assertEqual(results,expected)
+        # the call site receives values of several types from the threads at the same time
+        contexts = [{"a":str(i) if i % 2 else [str(i),"1"],"b":list(range(i)),"x":i % 7} for i in range(200)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(exp.parse('a.count("1")').eval,contexts))
+        self.assertEqual(results,[c['a'].count("1") for c in contexts])
+        operand = exp.parse('b.filter(p: p > x).map(p: p * x)')
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(operand.eval,contexts))
+        self.assertEqual(results,[[p*c['x'] for p in c['b'] if p > c['x']] for c in contexts])
+        # the array operations and the indexed assignments are solved by closures too, without the context on the nodes
+        operand = ArraySort('p',[Variable('b'),NegativeDecorator('-',[Variable('p')])])
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(operand.eval,contexts))
+        self.assertEqual(results,[sorted(c['b'],reverse=True) for c in contexts])
+        self.assertEqual(exp.eval(ArrayReverse('p',[Variable('b'),Variable('p')]),{"b":[3,1,2]}),[3,2,1])
+        self.assertEqual(exp.eval(ArraySort('',[Variable('b')]),{"b":[3,1,2]}),[1,2,3])
+        context = {"b":[1,2]}
+        self.assertEqual(exp.eval(ArrayPush('',[Variable('b'),Constant(3)]),context),[1,2,3])
+        self.assertEqual((exp.eval(ArrayPop('',[Variable('b')]),context),exp.eval(ArrayPop('',[Variable('b'),Constant(0)]),context)),(3,1))
+        exp.eval(ArrayRemove('',[Variable('b'),Constant(2)]),context)
+        self.assertEqual(context["b"],[])
+        operand = exp.parse('b[0] = a; b[1] += x; d["y"] = b[0]')
+        contexts = [{"a":i,"x":i % 7,"b":[0,1],"d":{}} for i in range(200)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(operand.eval,contexts))
+        self.assertEqual([(c["b"],c["d"]) for c in contexts],[([i,1 + i % 7],{"y":i}) for i in range(200)])
+
+    def test_cache(self):
+        size = exp.cacheSize
+        exp.cacheSize = 2
+        exp.clearCache()
+        info = exp.cacheInfo()
+        operand = exp.parse('a*2')
+        self.assertIs(exp.parse('a*2'),operand)
+        self.assertEqual(exp.solve('a*2',{"a":3}),6)
+        exp.parse('a*3')
+        exp.parse('a*4')
+        self.assertIsNot(exp.parse('a*2'),operand)
+        current = exp.cacheInfo()
+        self.assertEqual(current['size'],2)
+        self.assertEqual(current['hits']-info['hits'],2)
+        self.assertEqual(current['misses']-info['misses'],4)
+        self.assertEqual(current['evictions']-info['evictions'],2)
+        exp.addFunction('triple',lambda a: a*3)
+        self.assertEqual(exp.cacheInfo()['size'],0)
+        exp.cacheSize = size
+        # the lists and dicts of the shared operand are built on each evaluation
+        for expression in ['[1,2]','{a:[1]}','[1] + [2]']:
+            value = exp.solve(expression,{})
+            expected = exp.solve(expression,{})
+            (value.append if isinstance(value,list) else value['a'].append)(9)
+            self.assertEqual(exp.solve(expression,{}),expected,expression)
+            self.assertEqual(exp.optimize(exp.parse(expression)).eval({}),expected,expression)
+
+    def test_lexer(self):
+        lexemes = exp.lexer.tokenize('a.b >>= "x ""y"" "+ 1.5')
+        self.assertEqual([(p.kind,p.value,p.offset) for p in lexemes],
+                         [('value','a.b',0),('symbol','>>=',4),('string','x ""y"" ',8),('symbol','+',18),('value','1.5',20)])
+        self.assertEqual(exp.solve('!!a',{"a":1}),True)
+        self.assertEqual(exp.solve('a + .5',{"a":1}),1.5)
+        self.assertEqual(exp.minify(' a + "b c" '),'a+"b c"')
+        with self.assertRaises(ExpressionError):
+            exp.parse('a b')
+
+    def test_evalBatch(self):
+        columns = {"x":[-2,-1,0,1,2],"s":["a","b","c","d","e"],"c":{"k":[1,2,3,4,5]}}
+        rows = [{"x":x,"s":s,"c":{"k":k}} for x,s,k in zip(columns['x'],columns['s'],columns['c']['k'])]
+        for expression in ['sin(x)','x*c.k+1','x>0 && 1/x>0.5','x!=0 || s','s.upper()','x//2 + floor(c.k/2)','b=x*2']:
+            operand = exp.parse(expression)
+            expected = [operand.eval(dict(p)) for p in rows]
+            result = exp.evalBatch(operand,columns)
+            self.assertEqual(list(result) if np is None else result.tolist(),expected,expression)
+        # the integer results out of int64 are solved row by row instead of wrapping
+        big = [2**62,3,-2**63+1]
+        columns = {"x":big if np is None else np.array(big),"y":[-1,2,1]}
+        rows = [{"x":x,"y":y} for x,y in zip(big,columns['y'])]
+        for expression in ['x*4','x+x','x << 2','x ** 3','-x','x // y','x - 1','floor(x * 1.0e20)','x*0+1']:
+            operand = exp.parse(expression)
+            expected = [operand.eval(dict(p)) for p in rows]
+            result = exp.evalBatch(operand,columns)
+            self.assertEqual(list(result) if np is None else result.tolist(),expected,expression)
+        # the impure functions are solved row by row and only for the rows that eval solves
+        calls = []
+        exp.addFunction('record',lambda x: calls.append(x) or True)
+        result = exp.evalBatch(exp.parse('x > 0 && record(x)'),{"x":[-1,1,2]})
+        self.assertEqual((list(result) if np is None else result.tolist(),calls),([False,True,True],[1,2]))
+        # the operands are solved once when their operator falls back row by row
+        exp.addFunction('scale',lambda x: calls.append(x) or x,pure=True)
+        del calls[:]
+        result = exp.evalBatch(exp.parse('scale(x) * 4 + 1'),columns)
+        self.assertEqual((list(result) if np is None else result.tolist(),calls),([p*4+1 for p in big],big))
+
+    def test_optimize(self):
+        self.assertEqual(exp.serialize(exp.optimize(exp.parse('a + 1 + 2'))),{'n':'+','t':'Addition','c':[{'n':'a','t':'Variable'},{'n':3,'t':'Constant'}]})
+        self.assertEqual(exp.serialize(exp.optimize(exp.parse('x * 1'),numeric=True)),{'n':'x','t':'Variable'})
+        # without numeric the identities are kept for operands that may not be numbers
+        self.assertEqual(exp.optimize(exp.parse('x * 1')).eval({"x":True}),1)
+        self.assertRaises(TypeError,exp.optimize(exp.parse('x + 0')).eval,{"x":"a"})
+        self.assertRaises(TypeError,exp.optimize(exp.parse('x & 0')).eval,{"x":1.5})
+        self.assertEqual(exp.serialize(exp.optimize(exp.parse('(2 - a) & 0'),numeric=True))['t'],'BitAnd')
+        for expression in ['x | 0','x ^ 0','x << 0','x >> 0','x & 0']:
+            self.assertRaises(TypeError,exp.optimize(exp.parse(expression),numeric=True).eval,{"x":1.5})
+        self.assertEqual(type(exp.optimize(exp.parse('x + 0.0'),numeric=True).eval({"x":1})),float)
+        # the pure functions are folded only to the values that the binary format writes
+        for expression in ['frexp(8.0)','sqrt(16.0)']:
+            operand = exp.optimize(exp.parse(expression))
+            self.assertEqual(exp.loads(exp.dumps(operand)).eval({}),exp.solve(expression,{}))
+        self.assertEqual(exp.serialize(exp.parse('a.filter(p: !!p)').optimize()),{'n':'p','t':'ArrayFilter','c':[{'n':'a','t':'Variable'},{'n':'p','t':'Variable'}]})
+        self.assertEqual(len(exp.optimize(exp.parse('(a+b)+(c+d)')).operands),4)
+        context = {"a":3,"b":4,"c":5,"d":6,"flag":1,"l":[1,2]}
+        for expression in ['a+1+b+2','a-1-2-b','2*a*3*b','"x"+"y"+"z"','a&0','true && a','a || false','!!flag','a**1-0','(a+b)+(c+d)*1','l.filter(p: !!p && true)']:
+            self.assertEqual(exp.optimize(exp.parse(expression)).eval(dict(context)),exp.solve(expression,dict(context)),expression)
+
+    def test_eliminateCommon(self):
+        class Number():
+            calls = 0
+            def __init__(self,value):self.value = value
+            def __mul__(self,other):
+                Number.calls+=1
+                return self.value*other
+        operand = exp.eliminateCommon(exp.parse('a*b > 1 && a*b < 10 && (a*b)+1 != 3'))
+        self.assertEqual(operand.eval({"a":Number(2),"b":3}),True)
+        self.assertEqual(Number.calls,1)
+
+        operand = exp.eliminateCommon(exp.parse('x=a*b; y=a*b+1; a=3; z=a*b; i=0; while(i<2){w=a*b; a=a+1; i=i+1}'))
+        self.assertEqual(exp.serialize(operand)['c'][1]['c'][1]['c'][0]['t'],'Shared')
+        context = {"a":2,"b":3}
+        operand.eval(context)
+        self.assertEqual(context,{"a":5,"b":3,"x":6,"y":7,"z":9,"i":2,"w":12})
+
+        statements = exp.eliminateCommon([exp.parse('c.x*2+1'),exp.parse('c.x*2-1'),exp.parse('c.x*3')])
+        self.assertEqual([p.operands[0].name == statements[0].operands[0].name for p in statements[:2]],[True,True])
+        self.assertEqual(type(statements[2]).__name__,'Multiplication')
+
+        # the values changed in place are not shared with the occurrences before the change, neither through another variable
+        exp.addFunction('total',lambda l: sum(l),pure=True)
+        expressions = ['x = total(l)','m = l','m.append(5)','y = total(l)','z = total(l)']
+        statements = exp.eliminateCommon([exp.parse(p) for p in expressions])
+        context = {"l":[1,2]}
+        for statement in statements: statement.eval(context)
+        self.assertEqual((context['x'],context['y'],context['z']),(3,8,8))
+        self.assertEqual(type(statements[4].operands[1]).__name__,'Shared')
+
+    def test_expressionSet(self):
+        class Data(dict):
+            reads = 0
+            def __getitem__(self,key):
+                Data.reads+=1
+                return dict.__getitem__(self,key)
+        rules = {"r1":exp.parse('price.value * qty > 100'),"r2":exp.parse('price.value * qty < 1000 && qty > 1'),"r3":exp.parse('total = price.value * qty')}
+        expressionSet = exp.newExpressionSet(rules,merge=True)
+        context = Data({"price":Data({"value":10}),"qty":20})
+        self.assertEqual(expressionSet.eval(context),{"r1":True,"r2":True,"r3":200})
+        # price, price.value and qty once, and total after the assignment 
+        self.assertEqual(Data.reads,4)
+        self.assertEqual(context['total'],200)
+        expressionSet = exp.newExpressionSet([exp.parse('a+1'),exp.parse('a=a+1'),exp.parse('a+1')])
+        self.assertEqual(expressionSet.eval({"a":1}),[2,2,3])
+        exp.addFunction('total',lambda l: sum(l),pure=True)
+        expressions = ['x = total(l)','l.append(5)','y = total(l)','l.append(1)','total(l) + l.pop()']
+        context = {"l":[1,2]}
+        self.assertEqual(exp.newExpressionSet(expressions,merge=True).eval({"l":[1,2]}),[exp.solve(p,context) for p in expressions])
+
+    def test_variablePaths(self):
+        context = {"p":100,"c":{"customer":{"address":{"zip":"1424"}}},"l":[{"a":{"b":1}},{"a":{"b":2}}],"m":[1,2]}
+        self.assertEqual(exp.eval(exp.parse('c.customer.address.zip'),context),'1424')
+        self.assertEqual(exp.eval(exp.parse('c.customer.phone'),context),None)
+        self.assertEqual(exp.eval(exp.parse('l.map(p: p.a.b + c.customer.address.number)'),{**context,"c":{"customer":{"address":{"number":4}}}}),[5,6])
+        self.assertEqual(exp.eval(exp.parse('l.map(p: m.map(q: p.a.b * q + p0))'),{**context,"p0":0}),[[1,2],[2,4]])
+        self.assertEqual(exp.eval(exp.parse('m.map(q: p + q)'),context),[101,102])
+        exp.eval(exp.parse('c.customer.address.zip = "2000"'),context)
+        self.assertEqual(context['c']['customer']['address']['zip'],'2000')
+        exp.eval(exp.parse('l.foreach(p: p.a.b += 10)'),context)
+        self.assertEqual([p['a']['b'] for p in context['l']],[11,12])
+
+    def test_slots(self):
+        operand = exp.parse('l.map(p: nvl(p.a,0) * 2).first(p: p > 1)')
+        def nodes(operand):
+            yield operand
+            for p in operand.operands:
+                yield from nodes(p)
+        self.assertEqual([p for p in nodes(operand) if hasattr(p,'__dict__')],[])
+        self.assertEqual(exp.parse('"a"').type,'str')
+        self.assertEqual(exp.parse('1.5').type,'float')
+        self.assertEqual(exp.eval(operand,{"l":[{"a":None},{"a":3}]}),6)
+        self.assertEqual(exp.solve('a.b + 1',{"a":{"b":1}}),2)
+
+    def test_stackEngine(self):
+        self.assertEqual(exp.solve('1 - 2*3 - 4'),1 - 2*3 - 4)
+        self.assertEqual(exp.solve('a - 2*b - 4 / 2 + c',{"a":1,"b":3,"c":2}),1 - 2*3 - 4 / 2 + 2)
+        expressions = ['(a + b * c - d) / e ** 2 % 7','a > 1 && b < 3 || c == 3','!(a > 1) && -b < 0','[a,b,{"x":c,"y":[d]}]','sqrt(a*a + b*b)',
+                       'l.filter(p: p>1 && p<5).map(p: p*b)','x = a; x += b; x *= c; x','i=0;t=0;while(i<10){ if(i%2==0){t=t+i;}else{t=t-1;}; i=i+1;};t']
+        try:
+            for expression in expressions:
+                operand = exp.parse(expression)
+                contexts = [{"a":1,"b":2,"c":3,"d":4,"e":5,"l":[1,2,3,4,5]} for _ in range(2)]
+                exp.engine = 'closure'
+                expected = exp.eval(operand,contexts[0])
+                exp.engine = 'stack'
+                self.assertEqual(exp.eval(operand,contexts[1]),expected,expression)
+                self.assertEqual(contexts[1],contexts[0],expression)
+            statements = exp.eliminateCommon(exp.parse('x = a*b+1; y = a*b+1; x+y'))
+            self.assertEqual(exp.eval(statements,{"a":2,"b":3}),None)
+            self.assertEqual(exp.compile(exp.parse('a*b+1 > 2 && a*b+1 < 10'))({"a":2,"b":3}),True)
+            operand = exp.parse(' + '.join('a*{0}'.format(i) for i in range(10000)))
+            self.assertEqual(exp.eval(operand,{"a":2}),sum(2*i for i in range(10000)))
+            self.assertRaises(ExpressionError,setattr,exp,'engine','jit')
+        finally:
+            exp.engine = 'closure'
+
+    def test_binarySerialize(self):
+        expressions = ['a+1','-1.5*x - -3','"hola" + b.c','l.filter(p: p>1 && p<5).map(p: p*2)','if(a>1){b=2;}','[1,2,3]',
+                       '{"a":1,"b":x}','now()','!(a && b) || ~c','x = 300; while(x>0){x-=1;}','a[1]','true','sqrt(2)*y']
+        operands = [exp.parse(p) for p in expressions]
+        loaded = exp.loads(exp.dumps(operands))
+        self.assertEqual([exp.serialize(p) for p in loaded],[exp.serialize(p) for p in operands])
+        self.assertEqual(exp.eval(loaded[3],{"l":[1,2,3,4,5]}),[4,6,8])
+        catalogue = exp.loads(exp.dumps({"r1":operands[0],"r2":operands[4]}))
+        self.assertEqual(list(catalogue.keys()),["r1","r2"])
+        self.assertEqual(exp.eval(catalogue["r1"],{"a":1}),2)
+        self.assertEqual(exp.deserialize(exp.serialize(operands[4])).operands[2],None)
+        self.assertRaises(ExpressionError,exp.deserialize,{'n':'ls','t':'__import__("os").system'})
+        self.assertRaises(ExpressionError,exp.loads,b'PEXP')
+        self.assertRaises(ExpressionError,exp.loads,b'{"n":1}')
+        data = bytearray(exp.dumps(operands[0]))
+        data[4] = 99
+        self.assertRaises(ExpressionError,exp.loads,bytes(data))
+
+    def test_catalogue(self):
+        filename = os.path.join(tempfile.mkdtemp(),'rules.pexc')
+        rules = {"discount":'total > 100 && customer.type == "gold"',"tax":exp.parse('total * 0.5'),"names":'l.map(p: p.name)'}
+        self.assertEqual(exp.buildCatalogue(rules,filename),3)
+        with exp.loadCatalogue(filename) as catalogue:
+            self.assertEqual(len(catalogue),3)
+            self.assertEqual(list(catalogue.keys()),["discount","names","tax"])
+            self.assertEqual(catalogue.loaded,0)
+            self.assertEqual(exp.eval(catalogue["tax"],{"total":200}),100)
+            self.assertEqual(catalogue.loaded,1)
+            self.assertIs(catalogue["tax"],catalogue["tax"])
+            self.assertEqual(exp.eval(catalogue["discount"],{"total":200,"customer":{"type":"gold"}}),True)
+            self.assertTrue("names" in catalogue)
+            self.assertEqual(catalogue.get("other"),None)
+            self.assertRaises(KeyError,lambda: catalogue["other"])
+        with open(filename,'wb') as f:
+            f.write(b'not a catalogue')
+        self.assertRaises(ExpressionError,exp.loadCatalogue,filename)
+
+    def test_dispatch(self):
+        class Money():
+            def __init__(self,amount): self.amount = amount
+        class Euro(Money):pass
+        exp.addFunction('cents',lambda value: value.amount * 100,['Money'])
+        exp.addFunction('half',lambda value: value / 2)
+        operand = exp.parse('x.cents()')
+        self.assertEqual(exp.eval(operand,{"x":Money(2)}),200)
+        self.assertEqual(exp.eval(operand,{"x":Euro(3)}),300)
+        self.assertEqual(exp.solve('a.half() + "ab".upper().lower().count("a")',{"a":8}),5)
+        self.assertEqual([exp.eval(exp.parse('p.strip()'),{"p":p}) for p in [' a ','b ']],['a','b'])
+        self.assertRaises(ExpressionError,exp.solve,'a.unknown()',{"a":1})
+        exp.addFunction('unknown',lambda value: value + 1,['int'])
+        self.assertEqual(exp.solve('a.unknown()',{"a":1}),2)
+        self.assertRaises(ExpressionError,exp.solve,'unknownFunction(1)')
+
+    def test_pureFunctions(self):
+        calls = []
+        def tariff(zone,weight):
+            calls.append(zone)
+            return {"north":10,"south":20}.get(str(zone),30) * weight
+        exp.addFunction('tariff',tariff,pure=True,cacheSize=2)
+        operand = exp.parse('tariff(zone,weight)')
+        self.assertEqual([exp.eval(operand,{"zone":p,"weight":2}) for p in ["north","north","south","north"]],[20,20,40,20])
+        self.assertEqual(calls,["north","south"])
+        self.assertEqual(exp.eval(operand,{"zone":"north","weight":2.0}),20.0)
+        self.assertEqual(exp.solve('tariff(zone,1)',{"zone":["a"]}),30)
+        info = exp.functionsInfo()['tariff']
+        self.assertEqual((info['hits'],info['misses'],info['size']),(2,3,2))
+        self.assertEqual(info['hitRate'],0.4)
+        self.assertRaises(ExpressionError,exp.addFunction,'lookup',tariff,cacheSize=10)
+        self.assertEqual(exp.serialize(exp.parse('sqrt(16) + a').optimize()),{'n':'+','t':'Addition','c':[{'n':4.0,'t':'Constant'},{'n':'a','t':'Variable'}]})
+        self.assertEqual(exp.serialize(exp.parse('now()').optimize())['t'],'Function')
+        self.assertTrue(exp.isPure(exp.parse('sqrt(a) + floor(b)')))
+        self.assertFalse(exp.isPure(exp.parse('sqrt(now())')))
+        statements = exp.eliminateCommon([exp.parse('sqrt(a) + 1'),exp.parse('sqrt(a) * 2')])
+        self.assertEqual(type(statements[0].operands[0]).__name__,'Shared')
+
+    def test_bind(self):
+        exp.addFunction('rate',lambda a: a * 2)
+        operand = exp.bind(exp.deserialize(exp.serialize(exp.parse('rate(a) + sqrt(b) + DayOfWeek.Monday'))))
+        self.assertEqual(exp.eval(operand,{"a":1,"b":4}),5.0)
+        exp.addFunction('rate',lambda a: a * 3)
+        self.assertEqual(exp.eval(operand,{"a":1,"b":4}),6.0)
+        try:
+            exp.engine = 'stack'
+            self.assertEqual(exp.eval(operand,{"a":1,"b":4}),6.0)
+        finally:
+            exp.engine = 'closure'
+        self.assertEqual(operand.operands[0].operands[0].binding.name,'rate')
+        with self.assertRaises(ExpressionError) as context:
+            exp.parse('missing(a) + other(b) + "a".upper()').bind()
+        self.assertEqual(str(context.exception),'functions not found: missing, other')
+
+    def test_lazyChains(self):
+        calls = []
+        exp.addFunction('visit',lambda x: calls.append(x) or x,pure=True)
+        context = {"items":[{"x":i,"y":i*10} for i in range(1000)]}
+        self.assertEqual(exp.solve('items.filter(p: visit(p.x) > 0).map(p: p.y).first(q: q > 10)',context),20)
+        self.assertEqual(calls,[0,1,2])
+        self.assertEqual(exp.solve('items.filter(p: p.x < 3).map(p: p.y)',context),[0,10,20])
+        # the items can be an endless iterator when the chain ends with first
+        self.assertEqual(exp.solve('items.map(p: p * 2).filter(p: p > 7).first(p: p % 3 == 0)',{"items":itertools.count()}),12)
+        # a body with side effects keeps the chain eager
+        exp.solve('total = 0;first = items.filter(p: (total += 1) > 0).first(p: p.x > 1)',context)
+        self.assertEqual((context['total'],context['first']['x']),(1000,2))
+        # the list is built first when the consumer assigns a variable that the source reads
+        self.assertEqual(exp.solve('list.map(p: p + k).map(q: k = q)',{"list":[1,2,3],"k":10}),[11,12,13])
+        self.assertEqual(exp.solve('list.filter(p: p > k).map(q: q + 1).foreach(r: k = r)',{"list":[1,2,3,4],"k":0}),None)
+        # and streams when it assigns only variables that the source does not read
+        context = {"list":itertools.count(),"k":10}
+        exp.solve('j = 0;result = list.map(p: p + k).first(q: (j += 1) > 1)',context)
+        self.assertEqual((context['j'],context['result']),(2,11))
+
+    def test_evalStream(self):
+        folder = tempfile.mkdtemp()
+        with open(os.path.join(folder,'orders.jsonl'),'w') as f:
+            f.write('{"id":1,"total":50}\n\n{"id":2,"total":150}\n{"id":3,"total":300}\n')
+        with open(os.path.join(folder,'orders.csv'),'w') as f:
+            f.write('id,total\n1,50\n2,150\n3,300\n')
+        operand = exp.parse('total * 2')
+        self.assertEqual(list(exp.evalStream(operand,exp.readJsonl(os.path.join(folder,'orders.jsonl')))),[100,300,600])
+        records = exp.readCsv(os.path.join(folder,'orders.csv'),types={"total":int})
+        self.assertEqual([p['id'] for p in exp.evalStream(exp.parse('total > 100'),records,filter=True)],['2','3'])
+        self.assertEqual(list(exp.evalStream(operand,({"total":i} for i in range(5)),chunkSize=2)),[[0,2],[4,6],[8]])
+        # the shared values are solved again for each record
+        statement = exp.eliminateCommon([exp.parse('(a * 2 + 1) * (a * 2 + 1)')])[0]
+        self.assertEqual(list(exp.evalStream(statement,[{"a":1},{"a":2}])),[9,25])
+        with open(os.path.join(folder,'orders.jsonl'),'a') as f:
+            f.write('{"id":4,\n')
+        with self.assertRaises(ExpressionError) as context:
+            list(exp.evalStream(operand,exp.readJsonl(os.path.join(folder,'orders.jsonl'))))
+        self.assertTrue(' line 5: ' in str(context.exception))
+
+    def test_evalParallel(self):
+        exp.addFunction('hypot',math.hypot,pure=True)
+        operand = exp.parse('hypot(a,b) + nvl(l.filter(p: p > a).map(p: p * 2).first(p: p > 5),0)')
+        contexts = [{"a":i,"b":i % 7,"l":[1,2,3,4,5]} for i in range(500)]
+        self.assertEqual(list(exp.evalParallel(operand,contexts,workers=2,chunkSize=30)),list(exp.evalStream(operand,contexts)))
+        with self.assertRaises(ExpressionError) as context:
+            list(exp.evalParallel(exp.parse('missing(a)'),contexts,workers=2))
+        self.assertEqual(str(context.exception),'functions not found: missing')
+
+    def test_evalAsync(self):
+        calls = []
+        active = [0,0]
+        async def lookup(service,key):
+            calls.append(service+':'+str(key))
+            active[0] += 1
+            active[1] = max(active)
+            await asyncio.sleep(0.01)
+            active[0] -= 1
+            return key * 10 if service == 'price' else key > 1
+        exp.addFunction('lookup',lookup)
+        self.assertEqual(asyncio.run(exp.evalAsync(exp.parse('lookup("price",a) + lookup("price",b) * 2'),{"a":1,"b":2})),50)
+        self.assertEqual(active[1],2)
+        self.assertEqual(asyncio.run(exp.evalAsync(exp.parse('{x: lookup("price",a), y: [lookup("stock",a), a + 1]}'),{"a":2})),{"x":20,"y":[True,3]})
+        self.assertEqual(asyncio.run(exp.evalAsync(exp.parse('items.filter(p: lookup("stock",p)).map(p: lookup("price",p))'),{"items":[1,2,3]})),[20,30])
+        calls.clear()
+        self.assertEqual(asyncio.run(exp.evalAsync(exp.parse('a > 5 && lookup("stock",a)'),{"a":1})),False)
+        self.assertEqual(asyncio.run(exp.evalAsync(exp.parse('items.first(p: lookup("stock",p))'),{"items":[1,2,3]})),2)
+        self.assertEqual(calls,['stock:1','stock:2'])
+        context = {"a":3,"b":0}
+        asyncio.run(exp.evalAsync(exp.parse('if(lookup("stock",a)){b = lookup("price",a) + 1;}'),context))
+        self.assertEqual(context["b"],31)
+        self.assertEqual(asyncio.run(exp.evalAsync(exp.parse('"ab".upper() + a'),{"a":"c"})),'ABc')
+        self.assertRaises(ExpressionError,exp.addFunction,'cached',lookup,pure=True,cacheSize=10)
+        # with side effects the elements and the arguments are solved one at a time in order
+        context = {"items":[1,2,3],"total":0}
+        self.assertEqual(asyncio.run(exp.evalAsync(exp.parse('items.map(p: total = total + lookup("price",p))'),context)),[10,30,60])
+        self.assertEqual(context["total"],60)
+        calls.clear()
+        exp.addFunction('note',lambda x: calls.append(x) or x)
+        self.assertEqual(asyncio.run(exp.evalAsync(exp.parse('[note("a"), lookup("price",1), note("b")]'),{})),["a",10,"b"])
+        self.assertEqual(calls,['a','price:1','b'])
+
+    def test_profile(self):
+        operand = exp.parse('sqrt(a) + items.filter(p: p > 2).map(p: p * 2).first(p: p > 6)')
+        profile = exp.profile(operand,[{"a":4,"items":[1,2,3,4,5]}]*10)
+        self.assertEqual(profile.evaluations,10)
+        self.assertEqual(profile.nodes[()].calls,10)
+        self.assertEqual(profile.nodes[(0,)].name,'sqrt')
+        self.assertEqual(profile.nodes[(1,0,0)].type,type(exp.getOperandByPath(operand,[1,0,0])).__name__)
+        # the bodies of the lazy chain are solved for all the elements while profiling
+        self.assertEqual(profile.nodes[(1,0,0,1)].calls,50)
+        self.assertEqual(profile.functions()['sqrt']['calls'],10)
+        root = profile.nodes[()]
+        self.assertAlmostEqual(root.total,sum(p.own for p in profile.nodes.values()),places=6)
+        self.assertTrue('Function:sqrt' in profile.report())
+        self.assertTrue(profile.collapsed().split('\n')[0].startswith('/ Addition:+'))
+        self.assertIsNone(operand.compiled)
+        sampler = exp.sampler(operand,every=4)
+        self.assertEqual([sampler({"a":4,"items":[1,2,3,4,5]}) for _ in range(8)],[10.0]*8)
+        self.assertEqual((sampler.profile.evaluations,sampler.profile.nodes[()].calls),(2,2))
+
+    def test_budget(self):
+        loop = exp.parse('i = 0;while(true){i += 1;}')
+        with self.assertRaises(BudgetError) as context:
+            exp.eval(loop,{},budget=Budget(steps=1000))
+        self.assertEqual(str(context.exception),'budget of 1000 steps exceeded')
+        self.assertRaises(BudgetError,exp.eval,loop,{},budget=Budget(timeout=0.01))
+        budget = Budget()
+        timer = threading.Timer(0.01,budget.cancel)
+        timer.start()
+        self.assertRaises(BudgetError,exp.eval,loop,{},budget=budget)
+        self.assertRaises(BudgetError,exp.eval,exp.parse('s = "";while(true){s = s + "xx";}'),{},budget=Budget(maxSize=100))
+        self.assertRaises(BudgetError,exp.eval,exp.parse('items.map(p: p * 2)'),{"items":list(range(50))},budget=Budget(maxSize=10))
+        self.assertRaises(BudgetError,exp.eval,exp.parse('items.filter(p: p > 1).map(p: p * 2).first(p: p < 0)'),{"items":list(range(50))},budget=Budget(steps=20))
+        # the budget is started again by each evaluation
+        budget = Budget(steps=10)
+        self.assertEqual([exp.eval(exp.parse('l.map(p: p + 1)'),{"l":[1,2,3]},budget=budget) for _ in range(5)][-1],[2,3,4])
+        self.assertEqual(list(exp.evalStream(exp.parse('l.map(p: p + 1)'),[{"l":[1,2,3]}]*5,budget=budget))[-1],[2,3,4])
+        self.assertTrue(issubclass(BudgetError,ExpressionError))
+
+    def test_reactiveGraph(self):
+        expressions = {"tax":'tax = total * 0.2',"total":'total = price * qty',"label":'name.upper()'
+                      ,"selected":'items.filter(p: p > min).map(p: p * qty)',"grand":'total + tax'}
+        graph = exp.newReactiveGraph(expressions,{"price":10,"qty":2,"name":"ab","items":[1,2,3],"min":1})
+        self.assertEqual(len(graph),5)
+        self.assertEqual((graph["total"],graph["tax"],graph["grand"],graph["label"],graph["selected"]),(20,4.0,24.0,'AB',[4,6]))
+        self.assertEqual(graph.update({"price":20}),{"total":40,"tax":8.0,"grand":48.0})
+        self.assertEqual(graph.update({"min":2}),{"selected":[6]})
+        self.assertEqual(list(graph.update({"qty":1}).keys()),["total","tax","selected","grand"])
+        self.assertEqual(graph.update({"other":1}),{})
+        self.assertEqual(graph["label"],'AB')
+        with self.assertRaises(ExpressionError) as context:
+            exp.newReactiveGraph({"a":'x = y + 1',"b":'y = x + 1',"c":'i += 1'})
+        self.assertEqual(str(context.exception),'cyclic dependencies between: a, b')
+
+    def test_ruleIndex(self):
+        rules = {"ar":'c.country == "AR" && amount > 1000 && segment == "gold"'
+                ,"small":'amount <= 100 && 10 <= amount'
+                ,"any":'c.country == "AR" || qty > 1'
+                ,"name":'segment == "gold" && name.startswith("a")'
+                ,"big":'1000 < amount && c.country == "AR"'
+                ,"count":'(n = qty) > 2 && amount > 0'
+                ,"tags":'tags == "a"'}
+        index = exp.newRuleIndex(rules)
+        self.assertEqual(len(index),7)
+        contexts = [{"c":{"country":"AR"},"amount":1500,"segment":"gold","name":"ana","qty":1,"tags":"a"}
+                   ,{"c":{"country":"BR"},"amount":50,"segment":"gold","name":"bob","qty":3,"tags":["a"]}
+                   ,{"c":{"country":"AR"},"amount":1000,"segment":"silver","name":"ana","qty":0}
+                   ,{"c":{},"amount":10.0,"segment":"gold","name":"ana","qty":5}]
+        for context in contexts:
+            expected = [key for key,rule in rules.items() if exp.solve(rule,dict(context))]
+            self.assertEqual(index.match(dict(context)),expected)
+        self.assertEqual(index.match(contexts[0]),["ar","any","name","big","tags"])
+        # the values that the index can not compare solve the rules that read them, as eval does
+        self.assertRaises(TypeError,index.match,{"c":{"country":"AR"},"amount":None,"segment":"gold","qty":0})
+        # a path that can not be read only sends the rules that read it to the full evaluation
+        index = exp.newRuleIndex({"r1":'kind == "scalar" || x > 0',"r2":'kind == "obj" && x.y == 1'})
+        self.assertEqual(index.match({"kind":"scalar","x":5}),["r1"])
+        self.assertEqual(index.match({"kind":"scalar","x":{"y":1}}),["r1"])
+        # the conditions after one that is not indexed are solved in order, as eval does
+        index = exp.newRuleIndex({"r":'name.startswith("a") && segment == "gold"'})
+        self.assertRaises(ExpressionError,index.match,{"name":None,"segment":"silver"})
+        calls = []
+        exp.addFunction('record',lambda x: calls.append(x) or True)
+        index = exp.newRuleIndex({"r":'record(a) && a == 1'})
+        self.assertEqual((index.match({"a":2}),calls),([],[2]))
+
 # context = {"a":"1","b":2,"c":{"a":4,"b":5}}
 # exp.solve('a=8',context)
 # print(context['a'])